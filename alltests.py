@@ -3,5 +3,11 @@ import unittest
 from rstest import *
 from polynomialtest import *
 from fftest import *
+from paralleltest import *
+from erasuretest import *
+from rsfiletest import *
+from containertest import *
+from scrubtest import *
+from tablecachetest import *
 
 unittest.main()
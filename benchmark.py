@@ -0,0 +1,76 @@
+# Copyright (c) 2010 Andrew Brown <brownan@cs.duke.edu, brownan@gmail.com>
+# See LICENSE.txt for license terms
+
+"""Times polynomial multiplication and evaluation over GF(2^8) for a range of
+degrees, comparing the original Polynomial methods on GF256int coefficients
+against the GFPolynomial ones they now use.
+
+Run it as a script. With -n the NumPy paths are turned off.
+"""
+
+import sys
+import random
+import timeit
+
+import ff
+import polynomial
+from polynomial import Polynomial, GFPolynomial
+
+degrees = (8, 16, 32, 64, 128, 255)
+
+def schoolbook_mul(a, b):
+    "Polynomial.__mul__ as it was, one GF256int product per pair of terms"
+    terms = [0] * (len(a) + len(b))
+    for i1, c1 in enumerate(reversed(a.coefficients)):
+        if c1 == 0:
+            continue
+        for i2, c2 in enumerate(reversed(b.coefficients)):
+            terms[i1+i2] += c1*c2
+    return Polynomial(reversed(terms))
+
+def power_evaluate(p, x):
+    "Polynomial.evaluate as it was, keeping a running power of x"
+    c = 0
+    power = 1
+    for term in reversed(p.coefficients):
+        c = c + term * power
+        power = power * x
+    return c
+
+def best(f, number):
+    "Seconds per call of f, the best of three runs"
+    return min(timeit.repeat(f, number=number, repeat=3)) / number
+
+def main():
+    if "-n" in sys.argv:
+        polynomial.numpy = None
+    random.seed(0)
+    element = ff.GF256int
+    points = [element(x) for x in xrange(1, 256)]
+    print "%6s %12s %12s %8s %12s %12s %8s" % ("degree", "mul before",
+            "mul after", "speedup", "eval before", "eval after", "speedup")
+    for degree in degrees:
+        a = [random.randrange(1, 256) for _ in xrange(degree + 1)]
+        b = [random.randrange(1, 256) for _ in xrange(degree + 1)]
+        pa = Polynomial(element(c) for c in a)
+        pb = Polynomial(element(c) for c in b)
+        ga = GFPolynomial(reversed(a))
+        gb = GFPolynomial(reversed(b))
+        assert (ga * gb).to_polynomial() == schoolbook_mul(pa, pb)
+        assert ga.evaluate_many(points) == [power_evaluate(pa, x)
+                for x in points]
+
+        number = max(1, 2000 // degree)
+        mul_before = best(lambda: schoolbook_mul(pa, pb), number)
+        mul_after = best(lambda: ga * gb, number)
+        # Every non-zero point, as a Chien search or the syndromes would
+        eval_before = best(lambda: [power_evaluate(pa, x) for x in points],
+                max(1, number // 10))
+        eval_after = best(lambda: ga.evaluate_many(points), number)
+        print "%6d %10.3fms %10.3fms %7.1fx %10.3fms %10.3fms %7.1fx" % (
+                degree, mul_before * 1000, mul_after * 1000,
+                mul_before / mul_after, eval_before * 1000, eval_after * 1000,
+                eval_before / eval_after)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# Copyright (c) 2010 Andrew Brown <brownan@cs.duke.edu, brownan@gmail.com>
+# See LICENSE.txt for license terms
+
+"""This module implements a self-describing container format for
+Reed-Solomon encoded data.
+
+The raw output of rs.py is a bare run of codewords: n and k, the original
+length and where the padding is are all implicit. A container file instead
+looks like this:
+
+    header      HEADER_SIZE bytes
+    data        one n byte codeword per k bytes of data
+    index       optional, the CRC-32 of every data codeword, itself RS encoded
+    footer      HEADER_SIZE bytes, the same format as the header
+
+The header and footer hold a magic number, n, k, the field parameters, the
+original data length, and the data and index block counts. They are
+protected by their own RS(64,32) code, so up to 16 damaged bytes in either
+one can be corrected. The data blocks are padded at the end, so the data
+length says exactly how much of the last one is real; binary data round trips
+exactly.
+
+Blocks are a fixed stride apart, so block i is always at
+HEADER_SIZE + i*n. The index lets a reader validate a block with a CRC check
+instead of computing its syndromes; only blocks that fail it are decoded.
+
+A writer doesn't need to know the length of the data in advance. It writes a
+header marked incomplete, and the footer at the end has the final values. If
+the output is seekable the header is rewritten with them as well. Readers use
+whichever of the two is complete.
+"""
+
+import struct
+import zlib
+
+import rs
+
+HEADER_SIZE = 64
+MAGIC = "RSCF"
+VERSION = 1
+
+# The field this implementation supports, x^8 + x^4 + x^3 + x + 1 with
+# generator 3, as recorded in the header
+FIELD_POLYNOMIAL = 0x11b
+FIELD_GENERATOR = 3
+
+FLAG_COMPLETE = 1
+FLAG_INDEX = 2
+
+_header_format = ">4sBBBHBBQQIx"
+_header_coder = rs.RSCoder(HEADER_SIZE, HEADER_SIZE // 2)
+
+def _pack_header(n, k, flags, length, blocks, index_blocks):
+    message = struct.pack(_header_format, MAGIC, VERSION, n, k,
+            FIELD_POLYNOMIAL, FIELD_GENERATOR, flags, length, blocks,
+            index_blocks)
+    return _header_coder.encode(message)
+
+def _unpack_header(data):
+    """Decodes and parses a header or footer. Returns a dict of its fields, or
+    None if it is damaged beyond repair or isn't a header at all."""
+    if len(data) != HEADER_SIZE:
+        return None
+    code = bytearray(data)
+    if _header_coder.decode_into(code) < 0:
+        return None
+    (magic, version, n, k, poly, generator, flags, length, blocks,
+            index_blocks) = struct.unpack(_header_format,
+                    str(code[:HEADER_SIZE // 2]))
+    if magic != MAGIC or version != VERSION:
+        return None
+    return dict(n=n, k=k, poly=poly, generator=generator, flags=flags,
+            length=length, blocks=blocks, index_blocks=index_blocks)
+
+class ContainerWriter(object):
+    def __init__(self, fileobj, n=255, k=223, index=True):
+        """Writes a container to the file-like object fileobj, encoding with
+        RSCoder(n, k). If index is True, a block index is written at the end.
+        """
+        self.fileobj = fileobj
+        self.coder = rs.get_coder(n, k)
+        self.n = n
+        self.k = k
+        self.index = index
+        self.length = 0
+        self.blocks = 0
+        self._crcs = []
+        self._pending = ""
+        self.closed = False
+
+        try:
+            self._start = fileobj.tell()
+        except (AttributeError, IOError):
+            self._start = None
+        fileobj.write(_pack_header(n, k, FLAG_INDEX if index else 0, 0, 0, 0))
+
+    def write(self, data):
+        """Appends data to the container"""
+        k = self.k
+        self.length += len(data)
+        data = self._pending + data
+        full = len(data) - len(data) % k
+        for i in xrange(0, full, k):
+            self._write_block(data[i:i+k])
+        self._pending = data[full:]
+
+    def _write_block(self, message):
+        code = self.coder.encode(bytearray(message).ljust(self.k, "\0"))
+        self.fileobj.write(code)
+        self.blocks += 1
+        if self.index:
+            self._crcs.append(zlib.crc32(code) & 0xffffffff)
+
+    def close(self):
+        """Writes the last block, the index and the footer. If the output is
+        seekable, the header is rewritten with the final values too. The
+        file object is not closed."""
+        if self.closed:
+            return
+        if self._pending:
+            self._write_block(self._pending)
+            self._pending = ""
+
+        index_blocks = 0
+        flags = FLAG_COMPLETE
+        if self.index:
+            flags |= FLAG_INDEX
+            index = struct.pack(">%dI" % len(self._crcs), *self._crcs)
+            for i in xrange(0, len(index), self.k):
+                block = bytearray(index[i:i+self.k]).ljust(self.k, "\0")
+                self.fileobj.write(self.coder.encode(block))
+                index_blocks += 1
+
+        header = _pack_header(self.n, self.k, flags, self.length,
+                self.blocks, index_blocks)
+        self.fileobj.write(header)
+
+        if self._start is not None:
+            try:
+                end = self.fileobj.tell()
+                self.fileobj.seek(self._start)
+                self.fileobj.write(header)
+                self.fileobj.seek(end)
+            except IOError:
+                # Not seekable after all, the footer is enough
+                pass
+        self.closed = True
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ContainerReader(object):
+    def __init__(self, fileobj):
+        """Reads a container from the seekable file-like object fileobj.
+        Raises ValueError if neither the header nor the footer can be read.
+        """
+        self.fileobj = fileobj
+        fileobj.seek(0)
+        header = _unpack_header(fileobj.read(HEADER_SIZE))
+        if header is None or not header["flags"] & FLAG_COMPLETE:
+            fileobj.seek(-HEADER_SIZE, 2)
+            footer = _unpack_header(fileobj.read(HEADER_SIZE))
+            if footer is not None and footer["flags"] & FLAG_COMPLETE:
+                header = footer
+        if header is None or not header["flags"] & FLAG_COMPLETE:
+            raise ValueError("Not a container, or the header and footer are"
+                    " both damaged")
+        if (header["poly"], header["generator"]) != (FIELD_POLYNOMIAL,
+                FIELD_GENERATOR):
+            raise ValueError("Unsupported field parameters")
+
+        self.n = header["n"]
+        self.k = header["k"]
+        self.length = header["length"]
+        self.blocks = header["blocks"]
+        self.coder = rs.get_coder(self.n, self.k)
+
+        self._crcs = None
+        if header["flags"] & FLAG_INDEX:
+            self._crcs = self._read_index(header["index_blocks"])
+
+    def _read_index(self, index_blocks):
+        """Reads and decodes the index. Returns a list of the CRC-32 of every
+        data block, or None if the index can't be decoded."""
+        n = self.n
+        self.fileobj.seek(HEADER_SIZE + self.blocks * n)
+        data = []
+        for i in xrange(index_blocks):
+            code = bytearray(self.fileobj.read(n))
+            status = self.coder.decode_into(code)
+            if status < 0:
+                return None
+            data.append(str(code[:self.k]))
+        data = "".join(data)[:4 * self.blocks]
+        return list(struct.unpack(">%dI" % self.blocks, data))
+
+    def block(self, i):
+        """Returns the k data bytes of block i. The block is checked against
+        the index if there is one, and only decoded if that fails. Raises
+        IOError if it can't be corrected."""
+        if not 0 <= i < self.blocks:
+            raise IndexError("Block %d out of range" % i)
+        n = self.n
+        self.fileobj.seek(HEADER_SIZE + i * n)
+        code = self.fileobj.read(n)
+        if self._crcs is not None and (zlib.crc32(code) & 0xffffffff ==
+                self._crcs[i]):
+            return code[:self.k]
+
+        code = bytearray(code)
+        if self.coder.decode_into(code) < 0:
+            raise IOError("Block %d could not be corrected" % i)
+        return str(code[:self.k])
+
+    def read(self):
+        """Returns all of the data"""
+        data = "".join(self.block(i) for i in xrange(self.blocks))
+        return data[:self.length]
@@ -0,0 +1,73 @@
+import unittest
+from StringIO import StringIO
+
+import container
+
+class UnseekableFile(object):
+    """Accepts writes only, like a pipe"""
+    def __init__(self):
+        self.buf = StringIO()
+    def write(self, data):
+        self.buf.write(data)
+
+class TestContainer(unittest.TestCase):
+    def setUp(self):
+        # Leading null bytes used to get lost
+        self.data = "\0\0\0" + "".join(chr((i*13) % 256) for i in xrange(200))
+
+    def _write(self, f, **kwargs):
+        with container.ContainerWriter(f, 30, 10, **kwargs) as w:
+            for i in xrange(0, len(self.data), 7):
+                w.write(self.data[i:i+7])
+
+    def test_roundtrip(self):
+        f = StringIO()
+        self._write(f)
+        r = container.ContainerReader(f)
+        self.assertEqual((30, 10, 203, 21), (r.n, r.k, r.length, r.blocks))
+        self.assertEqual(self.data, r.read())
+        self.assertEqual(self.data[50:60], r.block(5))
+
+        # 21 blocks, 84 bytes of CRCs, 9 index blocks
+        self.assertEqual(2*64 + 21*30 + 9*30, len(f.getvalue()))
+
+    def test_no_index(self):
+        f = StringIO()
+        self._write(f, index=False)
+        r = container.ContainerReader(f)
+        self.assertEqual(None, r._crcs)
+        self.assertEqual(self.data, r.read())
+
+    def test_damage(self):
+        f = StringIO()
+        self._write(f)
+        data = list(f.getvalue())
+        # Damage the header, the index, and some blocks
+        for i in (0, 5, 63, 64 + 3*30 + 2, 64 + 21*30 + 1):
+            data[i] = chr(ord(data[i]) ^ 0xff)
+        r = container.ContainerReader(StringIO("".join(data)))
+        self.assertEqual(self.data, r.read())
+
+        # Too much damage in one block
+        for i in xrange(64 + 30, 64 + 41):
+            data[i] = chr(ord(data[i]) ^ 0xff)
+        r = container.ContainerReader(StringIO("".join(data)))
+        self.assertRaises(IOError, r.block, 1)
+
+    def test_streaming(self):
+        """An unseekable writer leaves the header incomplete"""
+        f = UnseekableFile()
+        self._write(f)
+        f = f.buf
+        header = container._unpack_header(f.getvalue()[:64])
+        self.assertFalse(header["flags"] & container.FLAG_COMPLETE)
+        r = container.ContainerReader(f)
+        self.assertEqual(self.data, r.read())
+
+    def test_not_container(self):
+        self.assertRaises(ValueError, container.ContainerReader,
+                StringIO("x" * 200))
+
+
+if __name__ == "__main__":
+    unittest.main()
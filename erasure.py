@@ -0,0 +1,171 @@
+# Copyright (c) 2010 Andrew Brown <brownan@cs.duke.edu, brownan@gmail.com>
+# See LICENSE.txt for license terms
+
+"""This module implements erasure coding for striping data across disks, using
+the GF(2^8) arithmetic in ff.py.
+
+An object is split into k equal data shards, and m parity shards are computed
+from them. Any k of the k+m shards are enough to rebuild all of the others.
+Unlike RSCoder, the shards can be any length: the code is applied column-wise,
+one byte from each shard at a time, so a stripe is as long as it needs to be.
+
+Parity shard i is the sum over the data shards j of C[i][j] * data_j, where C
+is the m by k Cauchy matrix
+    C[i][j] = 1 / (x_i + y_j)   with x_i = k + i and y_j = j
+Every square submatrix of a Cauchy matrix is invertible, so the data shards
+can be solved for from any k surviving shards.
+
+Shards are processed region_size bytes at a time, so the working set of each
+pass stays in cache however large the shards are. The work on each region is
+done by ff.gf_mul_region.
+"""
+
+from ff import multable, invtable, gf_mul_region
+
+class ErasureCoder(object):
+    def __init__(self, k, m, region_size=65536):
+        """Creates an erasure coder with k data shards and m parity shards.
+        k + m can be at most 256.
+        """
+        if k < 1 or m < 0:
+            raise ValueError("Need at least 1 data shard and 0 parity shards")
+        if k + m > 256:
+            raise ValueError("k + m must be at most 256")
+        if region_size < 1:
+            raise ValueError("region_size must be positive")
+        self.k = k
+        self.m = m
+        self.region_size = region_size
+
+        # The Cauchy matrix. x_i + y_j is never 0 since x_i >= k > y_j
+        self.matrix = [[invtable[(k + i) ^ j] for j in xrange(k)]
+                for i in xrange(m)]
+
+    def split(self, data):
+        """Splits data into k equal length data shards, returned as a list of
+        bytearrays. The end of the last shard is padded with null bytes; keep
+        len(data) to strip them again with join().
+        """
+        k = self.k
+        length = (len(data) + k - 1) // k
+        data = bytearray(data)
+        data.extend(bytearray(length * k - len(data)))
+        return [data[i*length:(i+1)*length] for i in xrange(k)]
+
+    def join(self, shards, length):
+        """Joins the k data shards back together and returns the first length
+        bytes as a string"""
+        return str(bytearray().join(shards[:self.k]))[:length]
+
+    def encode(self, data):
+        """Splits data into k data shards and computes the m parity shards.
+        Returns a list of the k+m shards as bytearrays.
+        """
+        shards = self.split(data)
+        shards.extend(self._combine(self.matrix, shards))
+        return shards
+
+    def reconstruct(self, shards, data_only=False):
+        """Rebuilds missing shards. shards is a list of k+m shards in order,
+        with None in place of each missing one. At least k of them must be
+        present. The missing shards are filled into the list, and the list of
+        their indices is returned.
+
+        Only the missing shards are computed. With data_only, missing parity
+        shards are left as None.
+        """
+        k = self.k
+        if len(shards) != k + self.m:
+            raise ValueError("Expected %d shards" % (k + self.m))
+        present = [i for i, shard in enumerate(shards) if shard is not None]
+        if len(present) < k:
+            raise ValueError("Need at least %d shards, only have %d" % (k,
+                len(present)))
+        if len(set(len(shards[i]) for i in present)) != 1:
+            raise ValueError("Shards must all be the same length")
+
+        missing_data = [i for i in xrange(k) if shards[i] is None]
+        missing_parity = [i for i in xrange(k, k + self.m)
+                if shards[i] is None]
+
+        if missing_data:
+            # Invert the rows of the encoding matrix for k of the survivors.
+            # The data shards come first in present, and their rows are unit
+            # vectors, so as few parity shards are used as possible.
+            used = present[:k]
+            rows = []
+            for i in used:
+                if i < k:
+                    rows.append([int(i == j) for j in xrange(k)])
+                else:
+                    rows.append(self.matrix[i - k])
+            inverse = _invert(rows)
+
+            rebuilt = self._combine([inverse[i] for i in missing_data],
+                    [shards[i] for i in used])
+            for i, shard in zip(missing_data, rebuilt):
+                shards[i] = shard
+
+        if missing_parity and not data_only:
+            rebuilt = self._combine([self.matrix[i - k]
+                for i in missing_parity], shards[:k])
+            for i, shard in zip(missing_parity, rebuilt):
+                shards[i] = shard
+
+        if data_only:
+            return missing_data
+        return missing_data + missing_parity
+
+    def decode(self, shards, length):
+        """Rebuilds the original data of the given length from a list of k+m
+        shards, with None for each missing one. Missing parity shards are not
+        computed.
+        """
+        shards = list(shards)
+        self.reconstruct(shards, data_only=True)
+        return self.join(shards, length)
+
+    def _combine(self, rows, sources):
+        """Returns a new bytearray for each row of coefficients in rows,
+        holding the sum over j of row[j] * sources[j]. Works a region at a
+        time."""
+        length = len(sources[0])
+        outputs = [bytearray(length) for row in rows]
+        targets = [memoryview(output) for output in outputs]
+
+        for start in xrange(0, length, self.region_size):
+            size = min(self.region_size, length - start)
+            for row, target in zip(rows, targets):
+                region = target[start:start+size]
+                for c, source in zip(row, sources):
+                    if c:
+                        gf_mul_region(c, buffer(source, start, size), region)
+        return outputs
+
+def _invert(matrix):
+    """Inverts a square matrix over GF(2^8), given as a list of lists of ints,
+    with Gauss-Jordan elimination. Raises ValueError if it is singular."""
+    size = len(matrix)
+    rows = [list(row) + [int(i == j) for j in xrange(size)]
+            for i, row in enumerate(matrix)]
+
+    for col in xrange(size):
+        for pivot in xrange(col, size):
+            if rows[pivot][col]:
+                break
+        else:
+            raise ValueError("Matrix is singular")
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+
+        # Scale the pivot row so the pivot is 1
+        mulrow = multable[invtable[rows[col][col]]]
+        rows[col] = [mulrow[x] for x in rows[col]]
+
+        # And eliminate the column from every other row
+        for r in xrange(size):
+            factor = rows[r][col]
+            if r != col and factor:
+                mulrow = multable[factor]
+                rows[r] = [x ^ mulrow[y] for x, y in zip(rows[r], rows[col])]
+
+    return [row[size:] for row in rows]
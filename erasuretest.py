@@ -0,0 +1,66 @@
+import unittest
+import itertools
+
+import erasure
+import ff
+from ff import GF256int
+
+class TestErasureCoder(unittest.TestCase):
+    def setUp(self):
+        self.coder = erasure.ErasureCoder(4, 3, region_size=5)
+        self.data = "".join(chr((i*31 + 7) % 256) for i in xrange(53))
+        self.shards = self.coder.encode(self.data)
+
+    def test_encode(self):
+        self.assertEqual(7, len(self.shards))
+        self.assertEqual(set([14]), set(len(s) for s in self.shards))
+        self.assertEqual(self.data, self.coder.join(self.shards, 53))
+
+        # Check one parity byte by hand
+        expected = GF256int(0)
+        for j in xrange(4):
+            expected += (GF256int(1) / GF256int((4 + 2) ^ j) *
+                    self.shards[j][9])
+        self.assertEqual(expected, self.shards[6][9])
+
+    def test_any_k(self):
+        """Every choice of 3 lost shards can be rebuilt"""
+        for lost in itertools.combinations(range(7), 3):
+            shards = [None if i in lost else s
+                    for i, s in enumerate(self.shards)]
+            rebuilt = self.coder.reconstruct(shards)
+            self.assertEqual(sorted(rebuilt), list(lost))
+            self.assertEqual(self.shards, shards)
+
+    def test_decode(self):
+        shards = [str(s) for s in self.shards]
+        shards[0] = shards[2] = shards[5] = None
+        self.assertEqual(self.data, self.coder.decode(shards, 53))
+
+    def test_data_only(self):
+        shards = list(self.shards)
+        shards[1] = shards[4] = None
+        self.assertEqual([1], self.coder.reconstruct(shards, data_only=True))
+        self.assertEqual(self.shards[1], shards[1])
+        self.assertEqual(None, shards[4])
+
+    def test_too_few(self):
+        shards = list(self.shards)
+        shards[0] = shards[1] = shards[2] = shards[3] = None
+        self.assertRaises(ValueError, self.coder.reconstruct, shards)
+
+    def test_fallback(self):
+        saved = ff.numpy
+        ff.numpy = None
+        try:
+            self.assertEqual(self.shards, self.coder.encode(self.data))
+            shards = list(self.shards)
+            shards[0] = shards[6] = None
+            self.coder.reconstruct(shards)
+        finally:
+            ff.numpy = saved
+        self.assertEqual(self.shards, shards)
+
+
+if __name__ == "__main__":
+    unittest.main()
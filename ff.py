@@ -1,6 +1,21 @@
 # Copyright (c) 2010 Andrew Brown <brownan@cs.duke.edu, brownan@gmail.com>
 # See LICENSE.txt for license terms
 
+import sys
+import binascii
+import threading
+from array import array
+from collections import OrderedDict
+
+import tablecache
+
+# NumPy is optional. It is only used by the region operations at the bottom
+# of this module, which fall back to pure python without it.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class GF256int(int):
     """Instances of this object are elements of the field GF(2^8)
     Instances are integers in the range 0 to 255
@@ -52,8 +67,9 @@ class GF256int(int):
 
     def __new__(cls, value):
         # Check cache
-        # Caching sacrifices a bit of speed for less memory usage. This way,
-        # there are only a max of 256 instances of this class at any time.
+        # All 256 instances are built once when this module is imported, so
+        # this is just a dict lookup. There are only ever 256 instances of
+        # this class.
         try:
             return GF256int.cache[value]
         except KeyError:
@@ -75,29 +91,21 @@ class GF256int(int):
     
     def __mul__(a, b):
         "Multiplication in GF(2^8)"
-        if a == 0 or b == 0:
-            return GF256int(0)
-        x = GF256int.logtable[a]
-        y = GF256int.logtable[b]
-        z = (x + y) % 255
-        return GF256int(GF256int.exptable[z])
+        return GF256int(multable[a][b])
     __rmul__ = __mul__
 
     def __pow__(self, power):
         if isinstance(power, GF256int):
             raise TypeError("Raising a Field element to another Field element is not defined. power must be a regular integer")
-        x = GF256int.logtable[self]
-        z = (x * power) % 255
-        return GF256int(GF256int.exptable[z])
+        return GF256int(gf_pow(self, power))
 
     def inverse(self):
-        e = GF256int.logtable[self]
-        return GF256int(GF256int.exptable[255 - e])
+        return GF256int(gf_inverse(self))
 
     def __div__(self, other):
-        return self * GF256int(other).inverse()
+        return GF256int(gf_div(self, other))
     def __rdiv__(self, other):
-        return self.inverse() * other
+        return GF256int(gf_div(other, self))
 
     def __repr__(self):
         n = self.__class__.__name__
@@ -122,4 +130,507 @@ class GF256int(int):
             if p & 0x100: p = p ^ 0x11b
 
         return GF256int(r)
-        
+
+
+# Flat-table arithmetic kernel
+#
+# The functions below work on plain integers in the range 0..255 and never
+# build GF256int objects, so they are what the hot paths in rs.py and
+# polynomial.py use. GF256int above is a thin wrapper around these tables.
+
+# Exponent table extended to 512 entries. The sum of two logs is at most 508,
+# so exptable_ext[log[a] + log[b]] never needs a % 255
+exptable_ext = bytearray(GF256int.exptable[:255] * 2 + (1, 3))
+
+# Logarithm table as a plain list. logtable[0] is left as 0 instead of None so
+# it can be indexed blindly; callers must special-case 0 themselves.
+logtable = [0] + list(GF256int.logtable[1:])
+
+# Multiplicative inverse of each element. invtable[0] is 0 by convention.
+invtable = bytearray(256)
+for _x in xrange(1, 256):
+    invtable[_x] = exptable_ext[255 - logtable[_x]]
+
+# Full 256x256 product table. multable[a] is a 256-byte bytearray holding a*b
+# for every b, which also makes it usable as a translate() table for
+# multiplying a whole buffer by the constant a. It's generated as one flat
+# table, which can come from the table cache.
+def _build_multable():
+    table = bytearray(256 * 256)
+    for x in xrange(1, 256):
+        lx = logtable[x]
+        for y in xrange(1, 256):
+            table[256*x + y] = exptable_ext[lx + logtable[y]]
+    return str(table)
+_table = tablecache.load("multable-8-11b-3", _build_multable, 256 * 256)
+multable = [bytearray(_table[256*_x:256*(_x+1)]) for _x in xrange(256)]
+del _table
+
+# Every field element is built once up front, so GF256int() is a dict lookup
+for _x in xrange(256):
+    GF256int(_x)
+del _x
+
+def gf_add(a, b):
+    """Adds (or subtracts) two field elements given as plain ints"""
+    return a ^ b
+gf_sub = gf_add
+
+def gf_mul(a, b):
+    """Multiplies two field elements given as plain ints"""
+    return multable[a][b]
+
+def gf_div(a, b):
+    """Divides a by b, both plain ints. Raises ZeroDivisionError if b is 0"""
+    if b == 0:
+        raise ZeroDivisionError("Division by 0 in GF(2^8)")
+    if a == 0:
+        return 0
+    return exptable_ext[logtable[a] + 255 - logtable[b]]
+
+def gf_inverse(a):
+    """Returns the multiplicative inverse of a plain int field element"""
+    if a == 0:
+        raise ZeroDivisionError("0 has no inverse in GF(2^8)")
+    return invtable[a]
+
+def gf_pow(a, power):
+    """Raises a plain int field element to an integer power. Negative powers
+    are allowed for non-zero a."""
+    if a == 0:
+        if power == 0:
+            return 1
+        if power < 0:
+            raise ZeroDivisionError("0 has no inverse in GF(2^8)")
+        return 0
+    return exptable_ext[(logtable[a] * power) % 255]
+
+def gf_mul_bytes(c, buf):
+    """Multiplies every byte of buf (a str, bytearray, or other buffer) by the
+    field element c. Returns a new bytearray.
+    """
+    return bytearray(buf).translate(multable[c])
+
+def gf_add_bytes(a, b):
+    """Adds (xors) two equal length buffers together, returning a new
+    bytearray"""
+    if len(a) != len(b):
+        raise ValueError("Buffers must be the same length")
+    a = bytearray(a)
+    b = bytearray(b)
+    return bytearray(x ^ y for x, y in zip(a, b))
+
+def gf_poly_eval(coefficients, x):
+    """Evaluates a polynomial given as a sequence of plain int coefficients in
+    order of decreasing power (like Polynomial.coefficients) at x using
+    Horner's method"""
+    mulrow = multable[x]
+    y = 0
+    for c in coefficients:
+        y = mulrow[y] ^ c
+    return y
+
+# Region operations
+#
+# Bulk coding (matrix encoding, erasure rebuilds, parity updates) comes down
+# to dst ^= c * src over long buffers. gf_mul_region does that for a whole
+# buffer at once using a 256 entry lookup table for the constant c: a NumPy
+# gather when NumPy is available, otherwise translate() and an xor of the
+# whole region as one long integer.
+
+# At most this many per-constant tables are kept
+region_table_cache_size = 64
+_region_tables = OrderedDict()
+_region_tables_lock = threading.Lock()
+
+def region_table(c):
+    """Returns the table for multiplying a buffer by the constant c, in the
+    form the current backend uses: a 256 entry uint8 NumPy array, or a 256
+    byte string for translate(). Tables are cached, least recently used
+    first out. Safe to call from several threads."""
+    key = (c, numpy is not None)
+    with _region_tables_lock:
+        try:
+            table = _region_tables.pop(key)
+        except KeyError:
+            if numpy is not None:
+                table = numpy.frombuffer(buffer(multable[c]),
+                        dtype=numpy.uint8)
+            else:
+                table = str(multable[c])
+            while len(_region_tables) >= region_table_cache_size:
+                _region_tables.popitem(last=False)
+        _region_tables[key] = table
+    return table
+
+def _as_numpy(buf):
+    """A zero copy uint8 NumPy view of any buffer"""
+    if isinstance(buf, numpy.ndarray):
+        return buf
+    if isinstance(buf, memoryview):
+        # numpy.frombuffer doesn't take memoryviews on python 2
+        return numpy.asarray(buf, dtype=numpy.uint8)
+    return numpy.frombuffer(buf, dtype=numpy.uint8)
+
+def gf_mul_region(c, src, dst, xor=True):
+    """Multiplies every byte of the buffer src by the field element c and
+    xors the result into the writable buffer dst of the same length, that is
+    dst ^= c * src. If xor is False, the product overwrites dst instead.
+
+    src may be any buffer: a string, bytearray, memoryview, mmap or NumPy
+    uint8 array. dst may be any writable one.
+    """
+    if len(src) != len(dst):
+        raise ValueError("Buffers must be the same length")
+    if len(src) == 0:
+        return
+
+    if numpy is not None:
+        src = _as_numpy(src)
+        dst = _as_numpy(dst)
+        if c == 0:
+            if not xor:
+                dst[:] = 0
+        elif c == 1:
+            if xor:
+                dst ^= src
+            else:
+                dst[:] = src
+        elif xor:
+            dst ^= numpy.take(region_table(c), src)
+        else:
+            numpy.take(region_table(c), src, out=dst)
+        return
+
+    if c == 0:
+        if not xor:
+            dst[:] = bytearray(len(dst))
+        return
+    product = bytearray(src)
+    if c != 1:
+        product = product.translate(region_table(c))
+    if xor:
+        x = (int(binascii.hexlify(dst), 16) ^
+                int(binascii.hexlify(product), 16))
+        product = binascii.unhexlify("%0*x" % (2 * len(dst), x))
+    dst[:] = product
+
+# Other fields
+#
+# Everything above is GF(2^8) with the polynomial 0x11b and generator 3. A
+# Field object describes GF(2^m) for any m from 2 to 16, with its own
+# primitive polynomial and generator. Its tables are only generated the first
+# time they're used, and field() keeps one Field per set of parameters, so a
+# big field like GF(2^16) is only paid for once, and only if it's used.
+
+# The polynomial and generator field(m) uses when none are given. For m = 8
+# that's the same field as GF256int.
+default_parameters = {
+        2: (0x7, 2),
+        3: (0xb, 2),
+        4: (0x13, 2),
+        5: (0x25, 2),
+        6: (0x43, 2),
+        7: (0x89, 2),
+        8: (0x11b, 3),
+        9: (0x211, 2),
+        10: (0x409, 2),
+        11: (0x805, 2),
+        12: (0x1053, 2),
+        13: (0x201b, 2),
+        14: (0x4443, 2),
+        15: (0x8003, 2),
+        16: (0x1100b, 2),
+        }
+
+class GFint(int):
+    """Base class for elements of a Field. Each Field makes a subclass of
+    this with its field attribute set, and works like GF256int does for
+    GF(2^8)."""
+    field = None
+
+    def __new__(cls, value):
+        try:
+            return cls.cache[value]
+        except KeyError:
+            if not 0 <= value < cls.field.size:
+                raise ValueError("Field elements of GF(2^%d) are between 0 and"
+                        " %d. Cannot be %s" % (cls.field.m,
+                            cls.field.size - 1, value))
+            newval = int.__new__(cls, value)
+            cls.cache[int(value)] = newval
+            return newval
+
+    def __add__(a, b):
+        "Addition is the xor of the two"
+        return a.__class__(a ^ b)
+    __sub__ = __add__
+    __radd__ = __add__
+    __rsub__ = __add__
+    def __neg__(self):
+        return self
+
+    def __mul__(a, b):
+        return a.__class__(a.field.mul(a, b))
+    __rmul__ = __mul__
+
+    def __pow__(self, power):
+        if isinstance(power, GFint):
+            raise TypeError("Raising a Field element to another Field element is not defined. power must be a regular integer")
+        return self.__class__(self.field.pow(self, power))
+
+    def inverse(self):
+        return self.__class__(self.field.inverse(self))
+
+    def __div__(self, other):
+        return self.__class__(self.field.div(self, other))
+    def __rdiv__(self, other):
+        return self.__class__(self.field.div(other, self))
+
+    def __repr__(self):
+        n = self.__class__.__name__
+        return "%s(%r)" % (n, int(self))
+
+class _MulRow(object):
+    """Stands in for a row of the product table in fields too big to have
+    one. row[b] is c*b, worked out from the log tables."""
+    __slots__ = ("exp", "log", "logc")
+
+    def __init__(self, field, c):
+        self.exp = field.exptable
+        self.log = field.logtable
+        self.logc = field.logtable[c] if c else None
+
+    def __getitem__(self, b):
+        if not b or self.logc is None:
+            return 0
+        return self.exp[self.logc + self.log[b]]
+
+class _MulRows(object):
+    """The product table of a field too big to have a real one"""
+    __slots__ = ("field",)
+
+    def __init__(self, field):
+        self.field = field
+
+    def __getitem__(self, c):
+        return _MulRow(self.field, c)
+
+class Field(object):
+    def __init__(self, m, poly, generator):
+        """GF(2^m) defined by the irreducible polynomial poly (given as an int
+        with bit i set for the x^i term, so 0x11b is x^8+x^4+x^3+x+1), with
+        generator as the primitive element the log tables are based on.
+
+        Use field() rather than creating these directly, so that each field
+        only has its tables generated once.
+        """
+        if not 2 <= m <= 16:
+            raise ValueError("m must be between 2 and 16")
+        if poly >> m != 1:
+            raise ValueError("poly must have degree %d" % m)
+        self.m = m
+        self.poly = poly
+        self.generator = generator
+        self.size = 1 << m
+        # The number of non-zero elements, which is also the period of the
+        # exponent table
+        self.order = self.size - 1
+
+        self._exptable = None
+        self._logtable = None
+        self._invtable = None
+        self._multable = None
+        self._numpy_tables = None
+
+        # The element class, like GF256int for this field
+        self.element = type("GF%dint" % self.size, (GFint,),
+                {"field": self, "cache": {}})
+
+    def __repr__(self):
+        return "Field(%d, %#x, %d)" % (self.m, self.poly, self.generator)
+
+    def _generate(self):
+        """Loads the exponent and log tables from the table cache, or
+        generates them"""
+        typecode = "B" if self.m <= 8 else "H"
+        explength = 2 * self.order + 1
+        itemsize = array(typecode).itemsize
+        name = "field-%d-%x-%d-%s" % (self.m, self.poly, self.generator,
+                sys.byteorder)
+        data = tablecache.load(name, self._build_tables,
+                (explength + self.size) * itemsize)
+
+        exptable = array(typecode)
+        exptable.fromstring(buffer(data, 0, explength * itemsize))
+        logtable = array(typecode)
+        logtable.fromstring(buffer(data, explength * itemsize))
+        self._exptable = exptable
+        self._logtable = logtable
+
+    def _build_tables(self):
+        """Generates the exponent and log tables, returning them one after
+        the other as a string. The exponent table is doubled in length so
+        that exptable[log[a] + log[b]] never needs a modulo."""
+        order = self.order
+        typecode = "B" if self.m <= 8 else "H"
+        exptable = array(typecode, [0]) * (2 * order + 1)
+        logtable = array(typecode, [0]) * self.size
+
+        x = 1
+        for i in xrange(order):
+            if i and x == 1:
+                raise ValueError("%d does not generate %r" % (self.generator,
+                    self))
+            exptable[i] = exptable[i + order] = x
+            logtable[x] = i
+            x = _multiply(x, self.generator, self.poly, self.m)
+        if x != 1:
+            raise ValueError("%#x is not irreducible" % self.poly)
+        exptable[2 * order] = exptable[1]
+        return exptable.tostring() + logtable.tostring()
+
+    @property
+    def exptable(self):
+        if self._exptable is None:
+            self._generate()
+        return self._exptable
+
+    @property
+    def logtable(self):
+        """The log table. logtable[0] is 0, callers must special-case 0"""
+        if self._logtable is None:
+            self._generate()
+        return self._logtable
+
+    @property
+    def invtable(self):
+        """Multiplicative inverse of each element. invtable[0] is 0."""
+        if self._invtable is None:
+            exptable = self.exptable
+            logtable = self.logtable
+            order = self.order
+            invtable = array(exptable.typecode, [0]) * self.size
+            for x in xrange(1, self.size):
+                invtable[x] = exptable[order - logtable[x]]
+            self._invtable = invtable
+        return self._invtable
+
+    @property
+    def multable(self):
+        """The product table: multable[a][b] is a*b. For fields of up to 8
+        bits the rows are real bytearrays. Bigger fields would need too much
+        memory for that, so their rows work it out from the log tables on
+        each lookup."""
+        if self._multable is None:
+            if self.m <= 8:
+                exptable = self.exptable
+                logtable = self.logtable
+                size = self.size
+                rows = [bytearray(size) for x in xrange(size)]
+                for x in xrange(1, size):
+                    row = rows[x]
+                    lx = logtable[x]
+                    for y in xrange(1, size):
+                        row[y] = exptable[lx + logtable[y]]
+                self._multable = rows
+            else:
+                self._multable = _MulRows(self)
+        return self._multable
+
+    def numpy_tables(self):
+        """Returns the exponent and log tables as NumPy arrays, and for
+        fields of up to 8 bits the whole product table as a 2-D array (None
+        for bigger fields). Made on first use. NumPy must be installed."""
+        if self._numpy_tables is None:
+            dtype = numpy.uint8 if self.m <= 8 else numpy.uint16
+            exptable = numpy.array(self.exptable, dtype=numpy.intp)
+            logtable = numpy.array(self.logtable, dtype=numpy.intp)
+            if self.m <= 8:
+                products = numpy.array([numpy.frombuffer(buffer(row),
+                    dtype=dtype) for row in self.multable])
+            else:
+                products = None
+            self._numpy_tables = (exptable, logtable, products)
+        return self._numpy_tables
+
+    def mul(self, a, b):
+        if a == 0 or b == 0:
+            return 0
+        return self.exptable[self.logtable[a] + self.logtable[b]]
+
+    def div(self, a, b):
+        """Divides a by b. Raises ZeroDivisionError if b is 0"""
+        if b == 0:
+            raise ZeroDivisionError("Division by 0 in %r" % self)
+        if a == 0:
+            return 0
+        return self.exptable[self.logtable[a] + self.order - self.logtable[b]]
+
+    def inverse(self, a):
+        if a == 0:
+            raise ZeroDivisionError("0 has no inverse in %r" % self)
+        return self.invtable[a]
+
+    def pow(self, a, power):
+        """Raises a to an integer power. Negative powers are allowed for
+        non-zero a."""
+        if a == 0:
+            if power == 0:
+                return 1
+            if power < 0:
+                raise ZeroDivisionError("0 has no inverse in %r" % self)
+            return 0
+        return self.exptable[(self.logtable[a] * power) % self.order]
+
+    def poly_eval(self, coefficients, x):
+        """Evaluates a polynomial given as a sequence of plain int
+        coefficients in order of decreasing power at x"""
+        mulrow = self.multable[x]
+        y = 0
+        for c in coefficients:
+            y = mulrow[y] ^ c
+        return y
+
+def _multiply(a, b, poly, m):
+    """Multiplies a and b in the field given by poly, the slow way (see
+    GF256int.multiply)"""
+    r = 0
+    top = 1 << m
+    while b:
+        if b & 1: r = r ^ a
+        b = b >> 1
+        a = a << 1
+        if a & top: a = a ^ poly
+    return r
+
+_fields = {}
+
+def field(m=8, poly=None, generator=None):
+    """Returns the Field for GF(2^m) with the given polynomial and generator,
+    creating it the first time it's asked for. The defaults come from
+    default_parameters, and field() with no arguments is the GF(2^8) that
+    GF256int uses."""
+    default_poly, default_generator = default_parameters.get(m, (None, 2))
+    if poly is None:
+        poly = default_poly
+    if generator is None:
+        generator = default_generator
+    key = (m, poly, generator)
+    try:
+        return _fields[key]
+    except KeyError:
+        if poly is None:
+            raise ValueError("m must be between 2 and 16")
+        f = _fields[key] = Field(m, poly, generator)
+        return f
+
+# GF256int's field uses the tables at the top of this module instead of
+# generating its own
+GF256 = field(8, 0x11b, 3)
+GF256._exptable = exptable_ext
+GF256._logtable = logtable
+GF256._invtable = invtable
+GF256._multable = multable
+GF256.element = GF256int
+GF256int.field = GF256
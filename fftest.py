@@ -1,6 +1,8 @@
 import unittest
 import itertools
+import threading
 
+import ff
 from ff import GF256int
 
 class TestGF256int(unittest.TestCase):
@@ -49,6 +51,161 @@ class TestGF256int(unittest.TestCase):
 
         self.assertEqual(a * b, a.multiply(b))
 
+class TestKernel(unittest.TestCase):
+    """Tests the plain int table kernel against the GF256int object"""
+    def test_multable(self):
+        for a in range(256):
+            for b in range(256):
+                self.assertEqual(ff.gf_mul(a, b),
+                        GF256int(a).multiply(GF256int(b)))
+
+    def test_inverse(self):
+        for a in range(1, 256):
+            self.assertEqual(ff.gf_mul(a, ff.gf_inverse(a)), 1)
+            self.assertEqual(ff.gf_inverse(a), GF256int(a).inverse())
+        self.assertRaises(ZeroDivisionError, ff.gf_inverse, 0)
+
+    def test_div_pow(self):
+        self.assertEqual(ff.gf_div(9, 3), 7)
+        self.assertEqual(ff.gf_div(0, 3), 0)
+        self.assertRaises(ZeroDivisionError, ff.gf_div, 3, 0)
+        self.assertEqual(ff.gf_pow(9, 3), 127)
+        self.assertEqual(ff.gf_pow(3, -1), ff.gf_inverse(3))
+        self.assertEqual(ff.gf_pow(0, 5), 0)
+        self.assertEqual(ff.gf_pow(0, 0), 1)
+
+    def test_bulk(self):
+        data = bytearray(range(256))
+        self.assertEqual(ff.gf_mul_bytes(9, data),
+                bytearray(ff.gf_mul(9, x) for x in data))
+        self.assertEqual(ff.gf_mul_bytes(9, "\x03"), bytearray("\x1b"))
+        self.assertEqual(ff.gf_add_bytes("\x03\x09", "\x09\x09"),
+                bytearray("\x0a\x00"))
+        self.assertRaises(ValueError, ff.gf_add_bytes, "ab", "a")
+
+    def test_poly_eval(self):
+        # 3x^2 + 9 evaluated at 3
+        self.assertEqual(ff.gf_poly_eval((3, 0, 9), 3),
+                GF256int(3)*3*3 + 9)
+
+class TestRegion(unittest.TestCase):
+    def _check(self):
+        src = "".join(chr(x) for x in xrange(256)) * 3
+        dst = bytearray(chr(x) for x in xrange(256)) * 3
+        expected = bytearray(ff.gf_mul(9, x) ^ x for x in xrange(256)) * 3
+        ff.gf_mul_region(9, src, dst)
+        self.assertEqual(expected, dst)
+
+        # Into a memoryview, overwriting
+        view = memoryview(dst)[10:20]
+        ff.gf_mul_region(3, src[:10], view, xor=False)
+        self.assertEqual(ff.gf_mul_bytes(3, src[:10]), dst[10:20])
+
+        ff.gf_mul_region(0, src[:10], view, xor=False)
+        self.assertEqual(bytearray(10), dst[10:20])
+        ff.gf_mul_region(1, src[:10], view)
+        self.assertEqual(bytearray(src[:10]), dst[10:20])
+
+        self.assertRaises(ValueError, ff.gf_mul_region, 3, "ab", dst)
+
+        empty = bytearray()
+        ff.gf_mul_region(5, "", empty)
+        ff.gf_mul_region(5, "", empty, xor=False)
+        self.assertEqual(bytearray(), empty)
+
+    @unittest.skipIf(ff.numpy is None, "NumPy is not installed")
+    def test_numpy(self):
+        self._check()
+
+    def test_fallback(self):
+        saved = ff.numpy
+        ff.numpy = None
+        try:
+            self._check()
+        finally:
+            ff.numpy = saved
+
+    def test_table_cache(self):
+        saved = ff.region_table_cache_size
+        ff.region_table_cache_size = 4
+        try:
+            for c in xrange(10):
+                ff.region_table(c)
+            self.assertTrue(len(ff._region_tables) <= 4)
+
+            # Several threads churning the cache at once
+            errors = []
+            def churn():
+                try:
+                    for i in xrange(2000):
+                        self.assertEqual(256, len(ff.region_table(i % 10)))
+                except Exception as e:
+                    errors.append(e)
+            threads = [threading.Thread(target=churn) for _ in xrange(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual([], errors)
+            self.assertTrue(len(ff._region_tables) <= 4)
+        finally:
+            ff.region_table_cache_size = saved
+
+class TestFields(unittest.TestCase):
+    def test_default(self):
+        self.assertTrue(ff.field() is ff.GF256)
+        self.assertTrue(ff.field(8) is ff.GF256)
+        self.assertTrue(ff.GF256.element is GF256int)
+        self.assertEqual(ff.GF256.mul(3, 9), 27)
+        self.assertEqual(ff.GF256.div(9, 3), 7)
+
+    def test_other_gf256(self):
+        """The same field from a different polynomial and generator"""
+        f = ff.field(8, 0x11d, 2)
+        for a in (1, 2, 87, 255):
+            for b in (1, 3, 100, 254):
+                self.assertEqual(f.mul(a, b), ff._multiply(a, b, 0x11d, 8))
+        self.assertEqual(f.multable[87][100], f.mul(87, 100))
+
+    def test_tables(self):
+        for m in xrange(2, 17):
+            f = ff.field(m)
+            self.assertEqual(f.size, 1 << m)
+            self.assertEqual(f.order, len(set(f.exptable[:f.order])))
+            for a in (1, 2, f.order // 3, f.order):
+                self.assertEqual(f.mul(a, f.inverse(a)), 1)
+                self.assertEqual(f.pow(a, f.order), 1)
+                self.assertEqual(f.mul(a, f.order - 1),
+                        ff._multiply(a, f.order - 1, f.poly, m))
+
+    def test_lazy(self):
+        f = ff.field(16)
+        self.assertTrue(ff.field(16) is f)
+        f = ff.Field(16, 0x1100b, 2)
+        self.assertEqual(None, f._exptable)
+        self.assertEqual(f.mul(300, 40000), ff.field(16).mul(300, 40000))
+        self.assertNotEqual(None, f._exptable)
+
+    def test_element(self):
+        element = ff.field(16).element
+        a = element(40000)
+        b = element(1234)
+        self.assertEqual(a + b, 40000 ^ 1234)
+        self.assertEqual(a * b / b, a)
+        self.assertEqual(a * a.inverse(), 1)
+        self.assertEqual(a**65535, 1)
+        self.assertTrue(isinstance(a * b, element))
+        self.assertRaises(ValueError, element, 65536)
+        self.assertRaises(ZeroDivisionError, lambda: a / element(0))
+
+    def test_bad_parameters(self):
+        self.assertRaises(ValueError, ff.field, 17)
+        self.assertRaises(ValueError, ff.field, 5, 0x13)
+        # 0x1f isn't irreducible, 1 never generates anything
+        self.assertRaises(ValueError, ff.Field(4, 0x1f, 2)._generate)
+        self.assertRaises(ValueError, ff.Field(4, 0x13, 1)._generate)
+
+
 
 if __name__ == "__main__":
     unittest.main()
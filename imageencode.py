@@ -1,63 +1,134 @@
 from PIL import Image
 import sys
+import tempfile
 
 import rs
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 rowstride = 255
 
-def encode(input, output_filename):
+# Image modes by the number of codewords stored in each row
+modes = {1: "L", 3: "RGB", 4: "RGBA"}
+
+# Rows of pixels handled at a time
+striprows = 64
+
+def encode(input, output_filename, channels=1):
     """Encodes the input data with reed-solomon error correction in 223 byte
     blocks, and outputs each block along with 32 parity bytes to a new file by
     the given filename.
 
     input is a file-like object
 
-    The outputted image will be in png format, and will be 255 by x pixels with
-    one color channel. X is the number of 255 byte blocks from the input. Each
-    block of data will be one row, therefore, the data can be recovered if no
-    more than 16 pixels per row are altered.
+    The outputted image will be in png format, and will be 255 by x pixels.
+    With one color channel, each block of data will be one row, therefore, the
+    data can be recovered if no more than 16 pixels per row are altered.
+
+    With channels=3 or 4 the image is RGB or RGBA, and each row holds that
+    many blocks, one per channel. Block c of a row is stored in channel c of
+    every pixel, so a damaged pixel costs at most one byte of each block.
+
+    The input is read and encoded a strip of rows at a time. The encoded
+    strips are spooled to a temporary file until the final height of the
+    image is known, so apart from the image itself only one strip is held in
+    memory.
     """
-    coder = rs.RSCoder(255,223)
+    coder = rs.get_coder(255,223)
+    mode = modes[channels]
+    stripsize = striprows * channels * 223
 
-    output = []
+    spool = tempfile.TemporaryFile()
+    rows = 0
+    for data in rs.read_chunks(input, stripsize):
+        # A short last block is padded at the front, as encode() would, and
+        # the last row is filled out with empty blocks
+        full = len(data) - len(data) % 223
+        if full < len(data):
+            data = data[:full] + data[full:].rjust(223, "\0")
+        blocks = len(data) // 223
+        data += "\0" * 223 * (-blocks % channels)
 
-    while True:
-        block = input.read(223)
-        if not block: break
-        code = coder.encode(block)
-        output.append(code)
+        codes = coder.encode_many(data)
+        spool.write(_interleave(codes, channels))
+        rows += len(codes) // channels
         sys.stderr.write(".")
 
     sys.stderr.write("\n")
 
-    out = Image.new("L", (rowstride,len(output)))
-    out.putdata("".join(output))
+    out = Image.new(mode, (rowstride,rows))
+    spool.seek(0)
+    for y in xrange(0, rows, striprows):
+        height = min(striprows, rows - y)
+        strip = spool.read(height * rowstride * channels)
+        out.paste(Image.frombuffer(mode, (rowstride,height), strip,
+            "raw", mode, 0, 1), (0, y))
+    spool.close()
     out.save(output_filename)
 
 def decode(input_filename):
-    coder = rs.RSCoder(255,223)
+    """Decodes an image made by encode() and writes the data to standard out.
+    The number of channels is taken from the image mode. The image is decoded
+    a strip of rows at a time, straight from its raw pixel bytes."""
+    coder = rs.get_coder(255,223)
     input = Image.open(input_filename)
-    data = "".join(chr(x) for x in input.getdata())
-    del input
+    channels = len(input.getbands())
+    if input.size[0] != rowstride or channels not in modes:
+        raise ValueError("Not an encoded image")
+    width, height = input.size
 
-    blocknum = 0
-    while True:
-        if blocknum*255 > len(data):
-            break
-        rowdata = data[blocknum*255:(blocknum+1)*255]
-
-        decoded = coder.decode(rowdata)
-
-        blocknum += 1
-        sys.stdout.write(str(decoded))
+    for y in xrange(0, height, striprows):
+        strip = input.crop((0, y, width, min(y + striprows, height)))
+        codes = _deinterleave(strip.tobytes(), channels)
+        messages = coder.decode_many(codes)[0]
+        for message in messages:
+            if numpy is not None:
+                message = message.tobytes()
+            sys.stdout.write(message.lstrip("\0"))
         sys.stderr.write(".")
     sys.stderr.write("\n")
 
+def _interleave(codes, channels):
+    """Turns a sequence of codewords, channels of them per row, into raw
+    pixel data with codeword c of each row in channel c of every pixel"""
+    if numpy is not None:
+        codes = numpy.asarray(codes, dtype=numpy.uint8)
+        return codes.reshape(-1, channels, rowstride).transpose(0, 2,
+                1).tobytes()
+    raw = bytearray(len(codes) * rowstride)
+    rowsize = rowstride * channels
+    for i, code in enumerate(codes):
+        row, c = divmod(i, channels)
+        raw[row*rowsize+c:(row+1)*rowsize:channels] = code
+    return str(raw)
+
+def _deinterleave(raw, channels):
+    """The inverse of _interleave, returning the codewords as one string"""
+    if channels == 1:
+        return raw
+    if numpy is not None:
+        raw = numpy.frombuffer(raw, dtype=numpy.uint8)
+        return raw.reshape(-1, rowstride, channels).transpose(0, 2,
+                1).tobytes()
+    rowsize = rowstride * channels
+    codes = []
+    for start in xrange(0, len(raw), rowsize):
+        for c in xrange(channels):
+            codes.append(raw[start+c:start+rowsize:channels])
+    return "".join(codes)
+
 if __name__ == "__main__":
     if "-d" == sys.argv[1]:
         # decode
         decode(sys.argv[2])
 
+    elif sys.argv[1] in ("-3", "-4"):
+        # encode into RGB or RGBA
+        encode(sys.stdin,sys.argv[2],channels=int(sys.argv[1][1]))
+
     else:
         # encode
         encode(sys.stdin,sys.argv[1])
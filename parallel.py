@@ -0,0 +1,165 @@
+# Copyright (c) 2010 Andrew Brown <brownan@cs.duke.edu, brownan@gmail.com>
+# See LICENSE.txt for license terms
+
+"""This module encodes and decodes streams of Reed-Solomon blocks on several
+processes at once.
+
+Blocks are independent of each other, so the stream is cut into chunks of
+many blocks and the chunks are handed out to a pool of worker processes. Each
+worker builds its own RSCoder once when it starts. Results come back in the
+same order the chunks went in, and only a bounded number of chunks are ever
+in flight, so memory use doesn't depend on the size of the input.
+
+When called as a script, this works like rs.py (RS code 255,223, -d to
+decode) but uses every core.
+"""
+
+import os
+import time
+import multiprocessing
+from collections import deque
+
+import rs
+
+# The coder for the current worker process, set up by _init_worker
+_coder = None
+
+def _init_worker(n, k):
+    global _coder
+    _coder = rs.get_coder(n, k)
+
+def _encode_chunk(chunk):
+    """Encodes a chunk of k byte blocks. The last block may be short."""
+    start = time.time()
+    k = _coder.k
+    out = "".join(_coder.encode(chunk[i:i+k])
+            for i in xrange(0, len(chunk), k))
+    return out, os.getpid(), len(chunk), time.time() - start
+
+def _decode_chunk(args):
+    """Decodes a chunk of n byte blocks"""
+    chunk, nostrip = args
+    start = time.time()
+    n = _coder.n
+    out = "".join(_coder.decode(chunk[i:i+n], nostrip=nostrip)
+            for i in xrange(0, len(chunk), n))
+    return out, os.getpid(), len(chunk), time.time() - start
+
+def _rechunk(data, size):
+    """Yields pieces of exactly size bytes (except the last one) from data,
+    which is either a file-like object or an iterable of strings"""
+    if hasattr(data, "read"):
+        # Puts short reads back together
+        for piece in rs.read_chunks(data, size):
+            yield piece
+        return
+
+    pending = []
+    pending_len = 0
+    for piece in data:
+        pending.append(piece)
+        pending_len += len(piece)
+        if pending_len >= size:
+            buf = "".join(pending)
+            # Walk the buffer rather than slicing off the front each time,
+            # which would copy the rest of it for every chunk
+            start = 0
+            while len(buf) - start >= size:
+                yield buf[start:start+size]
+                start += size
+            buf = buf[start:]
+            pending = [buf]
+            pending_len = len(buf)
+    if pending_len:
+        yield "".join(pending)
+
+class ParallelCoder(object):
+    def __init__(self, n=255, k=223, processes=None, chunk_blocks=1024,
+            max_pending=None):
+        """Creates a pool of worker processes, each with its own
+        RSCoder(n, k).
+
+        processes is the number of workers, by default the number of CPUs.
+        Work is handed out chunk_blocks blocks at a time. At most max_pending
+        chunks are queued or being worked on at once, by default twice the
+        number of workers.
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if max_pending is None:
+            max_pending = 2 * processes
+        if chunk_blocks < 1 or max_pending < 1:
+            raise ValueError("chunk_blocks and max_pending must be at least 1")
+        self.n = n
+        self.k = k
+        self.chunk_blocks = chunk_blocks
+        self.max_pending = max_pending
+
+        # Maps worker pid to [bytes processed, seconds spent]
+        self.stats = {}
+
+        # Make sure n and k are valid before starting any processes
+        rs.get_coder(n, k)
+        self.pool = multiprocessing.Pool(processes, _init_worker, (n, k))
+
+    def encode(self, data):
+        """Encodes data, either a file-like object or an iterable of strings,
+        in blocks of k bytes. Yields the encoded output a chunk at a time in
+        order. As with rs.py, a short final block is padded at the front with
+        null bytes.
+        """
+        chunks = _rechunk(data, self.k * self.chunk_blocks)
+        return self._run(_encode_chunk, chunks)
+
+    def decode(self, data, nostrip=False):
+        """Decodes data, either a file-like object or an iterable of strings,
+        in blocks of n bytes. Yields the decoded output a chunk at a time in
+        order. nostrip is passed on to RSCoder.decode.
+        """
+        chunks = _rechunk(data, self.n * self.chunk_blocks)
+        return self._run(_decode_chunk,
+                ((chunk, nostrip) for chunk in chunks))
+
+    def _run(self, func, tasks):
+        pending = deque()
+        for task in tasks:
+            if len(pending) >= self.max_pending:
+                yield self._collect(pending.popleft())
+            pending.append(self.pool.apply_async(func, (task,)))
+        while pending:
+            yield self._collect(pending.popleft())
+
+    def _collect(self, result):
+        out, pid, size, seconds = result.get()
+        stats = self.stats.setdefault(pid, [0, 0.0])
+        stats[0] += size
+        stats[1] += seconds
+        return out
+
+    def throughput(self):
+        """Returns a dict mapping each worker's pid to the number of input
+        bytes per second it has processed so far"""
+        return dict((pid, size / seconds if seconds else 0.0)
+                for pid, (size, seconds) in self.stats.iteritems())
+
+    def close(self):
+        """Shuts down the worker processes"""
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+if __name__ == "__main__":
+    import sys
+    with ParallelCoder(255, 223) as coder:
+        if "-d" in sys.argv:
+            output = coder.decode(sys.stdin)
+        else:
+            output = coder.encode(sys.stdin)
+        for piece in output:
+            sys.stdout.write(piece)
+        for pid, rate in sorted(coder.throughput().items()):
+            sys.stderr.write("worker %d: %.1f KB/s\n" % (pid, rate / 1024))
@@ -0,0 +1,50 @@
+import unittest
+from StringIO import StringIO
+
+import rs
+import parallel
+
+class ShortReadFile(object):
+    """Returns at most 3 bytes per read, like a pipe"""
+    def __init__(self, data):
+        self.buf = StringIO(data)
+    def read(self, size):
+        return self.buf.read(min(size, 3))
+
+class TestParallelCoder(unittest.TestCase):
+    def setUp(self):
+        self.coder = rs.RSCoder(30,10)
+        self.data = "".join(chr((i*13) % 256) for i in xrange(10*57 + 3))
+
+    def test_encode_decode(self):
+        expected = "".join(self.coder.encode(self.data[i:i+10])
+                for i in xrange(0, len(self.data), 10))
+
+        with parallel.ParallelCoder(30, 10, processes=2, chunk_blocks=4,
+                max_pending=3) as pcoder:
+            # Feed the input in pieces that don't line up with the chunks
+            pieces = [self.data[i:i+7] for i in xrange(0, len(self.data), 7)]
+            encoded = "".join(pcoder.encode(pieces))
+            self.assertEqual(expected, encoded)
+
+            decoded = "".join(pcoder.decode([encoded], nostrip=True))
+            # The short last block was padded at the front
+            self.assertEqual(self.data[:-3] + "\0"*7 + self.data[-3:],
+                    decoded)
+
+            stats = pcoder.throughput()
+            self.assertTrue(1 <= len(stats) <= 2)
+            self.assertEqual(sum(size for size, seconds in
+                pcoder.stats.values()), len(self.data) + len(encoded))
+
+    def test_rechunk(self):
+        pieces = list(parallel._rechunk(["abc", "defgh", "", "ij"], 4))
+        self.assertEqual(pieces, ["abcd", "efgh", "ij"])
+
+        # A file that returns at most 3 bytes per read, like a pipe
+        pieces = list(parallel._rechunk(ShortReadFile("abcdefghij"), 4))
+        self.assertEqual(pieces, ["abcd", "efgh", "ij"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,21 @@
 # See LICENSE.txt for license terms
 
 from StringIO import StringIO
+from array import array
+
+import ff
+
+# NumPy is optional. GFPolynomial uses it for multiplying big polynomials and
+# for evaluating at many points at once, and falls back to pure python.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Products where both polynomials have at least this many non-zero terms are
+# done with NumPy, when it's installed. Below that the per-row overhead of
+# NumPy costs more than it saves.
+numpy_mul_threshold = 48
 
 class Polynomial(object):
     """Completely general polynomial class.
@@ -40,14 +55,17 @@ class Polynomial(object):
                     " both")
         if coefficients:
             # Polynomial((1, 2, 3, ...))
-            c = list(coefficients)
+            c = tuple(coefficients)
             # Expunge any leading 0 coefficients
-            while c and c[0] == 0:
-                c.pop(0)
-            if not c:
-                c.append(0)
-
-            self.coefficients = tuple(c)
+            start = 0
+            while start < len(c) and c[start] == 0:
+                start += 1
+            if start == len(c):
+                c = (0,)
+            elif start:
+                c = c[start:]
+
+            self.coefficients = c
         elif sparse:
             # Polynomial(x32=...)
             powers = sparse.keys()
@@ -90,6 +108,15 @@ class Polynomial(object):
         return self + -other
             
     def __mul__(self, other):
+        field = self._field(other)
+        if field is not None:
+            # Both are polynomials over the same field from ff, so this can
+            # be done on plain ints in the log domain
+            product = (GFPolynomial(reversed(self.coefficients), field) *
+                    GFPolynomial(reversed(other.coefficients), field))
+            return self.__class__(field.element(c)
+                    for c in reversed(product.terms))
+
         terms = [0] * (len(self) + len(other))
 
         for i1, c1 in enumerate(reversed(self.coefficients)):
@@ -107,46 +134,48 @@ class Polynomial(object):
         return divmod(self, other)[1]
 
     def __divmod__(dividend, divisor):
-        """Implements polynomial long-division recursively. I know this is
-        horribly inefficient, no need to rub it in. I know it can even throw
-        recursion depth errors on some versions of Python.
-
-        However, not being a math person myself, I implemented this from my
-        memory of how polynomial long division works. It's straightforward and
-        doesn't do anything fancy. There's no magic here.
+        """Implements polynomial long-division iteratively, as synthetic
+        division on a single mutable list of coefficients. Returns the
+        quotient and the remainder.
+
+        Each pass of the loop works out how many times the highest order term
+        of the divisor goes into the highest remaining term of the dividend,
+        and subtracts that multiple of the divisor out of the terms below it.
+        The quotient coefficient is stored in place of the term it eliminated,
+        so when the loop is done the front of the list is the quotient and
+        the back of it is the remainder.
+
+        When the divisor is monic (leading coefficient 1, like the RS
+        generator polynomial) the division of each leading term is skipped.
         """
         class_ = dividend.__class__
 
-        # See how many times the highest order term
-        # of the divisor can go into the highest order term of the dividend
-
-        dividend_power = dividend.degree()
-        dividend_coefficient = dividend.coefficients[0]
+        terms = list(dividend.coefficients)
+        divisor_terms = divisor.coefficients
+        divisor_len = len(divisor_terms)
 
-        divisor_power = divisor.degree()
-        divisor_coefficient = divisor.coefficients[0]
-
-        quotient_power = dividend_power - divisor_power
-        if quotient_power < 0:
+        quotient_len = len(terms) - divisor_len + 1
+        if quotient_len <= 0:
             # Doesn't divide at all, return 0 for the quotient and the entire
             # dividend as the remainder
             return class_((0,)), dividend
 
-        # Compute how many times the highest order term in the divisor goes
-        # into the dividend
-        quotient_coefficient = dividend_coefficient / divisor_coefficient
-        quotient = class_( (quotient_coefficient,) + (0,) * quotient_power )
-
-        remander = dividend - quotient * divisor
+        divisor_coefficient = divisor_terms[0]
+        monic = divisor_coefficient == 1
+        tail = xrange(1, divisor_len)
 
-        if remander.coefficients == (0,):
-            # Goes in evenly with no remainder, we're done
-            return quotient, remander
+        for i in xrange(quotient_len):
+            quotient_coefficient = terms[i]
+            if not monic:
+                quotient_coefficient = quotient_coefficient / divisor_coefficient
+                terms[i] = quotient_coefficient
+            if quotient_coefficient == 0:
+                # Optimization
+                continue
+            for j in tail:
+                terms[i+j] = terms[i+j] - divisor_terms[j] * quotient_coefficient
 
-        # There was a remainder, see how many times the remainder goes into the
-        # divisor
-        morequotient, remander = divmod(remander, divisor)
-        return quotient + morequotient, remander
+        return class_(terms[:quotient_len]), class_(terms[quotient_len:])
 
     def __eq__(self, other):
         return self.coefficients == other.coefficients
@@ -178,23 +207,315 @@ class Polynomial(object):
 
     def evaluate(self, x):
         "Evaluate this polynomial at value x, returning the result."
-        # Holds the sum over each term in the polynomial
+        # Horner's method: starting from the highest power, multiply what
+        # there is so far by x and add the next coefficient
         c = 0
-
-        # Holds the current power of x. This is multiplied by x after each term
-        # in the polynomial is added up. Initialized to x^0 = 1
-        p = 1
-
-        for term in reversed(self.coefficients):
-            c = c + term * p
-
-            p = p * x
-
+        for term in self.coefficients:
+            c = c * x + term
         return c
 
+    def evaluate_many(self, points):
+        """Evaluates this polynomial at each of a sequence of points,
+        returning a list of the results. For polynomials over a field from
+        ff this is done by GFPolynomial.evaluate_many() on plain ints."""
+        field = self._field()
+        if field is None or not all(type(x) is field.element for x in points):
+            return [self.evaluate(x) for x in points]
+        p = GFPolynomial(reversed(self.coefficients), field)
+        return [field.element(y) for y in p.evaluate_many(points)]
+
+    def _field(self, *others):
+        """Returns the ff field every coefficient of this polynomial and the
+        others belongs to, or None if they aren't all elements of the same
+        one"""
+        element = type(self.coefficients[0])
+        field = getattr(element, "field", None)
+        if field is None or field.element is not element:
+            return None
+        for p in (self,) + others:
+            for c in p.coefficients:
+                if type(c) is not element:
+                    return None
+        return field
+
     def get_coefficient(self, degree):
         """Returns the coefficient of the specified term"""
         if degree > self.degree():
             return 0
         else:
             return self.coefficients[-(degree+1)]
+
+
+class GFPolynomial(object):
+    """A compact, mutable polynomial over one of the fields from ff.
+
+    Coefficients are plain ints, stored little-endian in a bytearray (or an
+    array of ints for fields over 8 bits): terms[i] is the coefficient of
+    x^i. Keeping the constant term first means the degree changes at the end
+    of the buffer, so growing or trimming a polynomial never moves the rest
+    of it. There are never any zero terms at the end, and the zero
+    polynomial has no terms at all.
+
+    The arithmetic operators return new polynomials like Polynomial's do,
+    and iadd(), imul_scalar() and shift() change a polynomial in place.
+    Arithmetic is done with the field's tables directly, no field element
+    objects are created.
+    """
+    __slots__ = ("field", "terms")
+
+    def __init__(self, terms=(), field=None):
+        """terms is a sequence of int coefficients in order of increasing
+        power. field is an ff.Field, GF(2^8) by default."""
+        if field is None:
+            field = ff.GF256
+        self.field = field
+        if field.m > 8:
+            self.terms = array("H", terms)
+        else:
+            self.terms = bytearray(terms)
+        self._trim()
+
+    @classmethod
+    def from_polynomial(cls, p, field=None):
+        """Converts a Polynomial to a GFPolynomial"""
+        return cls(reversed(p.coefficients), field)
+
+    def to_polynomial(self):
+        """Converts this to a Polynomial of field elements"""
+        element = self.field.element
+        return Polynomial(element(c) for c in reversed(self.terms))
+
+    def _new(self, terms):
+        p = GFPolynomial.__new__(GFPolynomial)
+        p.field = self.field
+        p.terms = terms
+        return p
+
+    def _zeros(self, size):
+        if self.field.m > 8:
+            return array("H", [0]) * size
+        return bytearray(size)
+
+    def _trim(self):
+        terms = self.terms
+        end = len(terms)
+        while end and not terms[end-1]:
+            end -= 1
+        if end != len(terms):
+            del terms[end:]
+
+    def copy(self):
+        return self._new(self.terms[:])
+
+    def __len__(self):
+        """Returns the number of terms, as Polynomial does"""
+        return len(self.terms) or 1
+    def degree(self):
+        return max(len(self.terms) - 1, 0)
+
+    def __getitem__(self, power):
+        """Returns the coefficient of x^power"""
+        if power < len(self.terms):
+            return self.terms[power]
+        return 0
+    get_coefficient = __getitem__
+
+    def __eq__(self, other):
+        return self.field is other.field and self.terms == other.terms
+    def __ne__(self, other):
+        return not self == other
+    __hash__ = None
+
+    def iadd(self, other):
+        """Adds (xors) other into this polynomial in place. Returns self."""
+        terms = self.terms
+        other = other.terms
+        if len(other) > len(terms):
+            terms.extend(self._zeros(len(other) - len(terms)))
+        for i, c in enumerate(other):
+            terms[i] ^= c
+        if len(other) == len(terms):
+            self._trim()
+        return self
+    isub = iadd
+
+    def __iadd__(self, other):
+        return self.iadd(other)
+    __isub__ = __iadd__
+
+    def __add__(self, other):
+        return self.copy().iadd(other)
+    __sub__ = __add__
+    def __neg__(self):
+        return self.copy()
+
+    def imul_scalar(self, c):
+        """Multiplies every coefficient by the field element c in place.
+        Returns self."""
+        terms = self.terms
+        if c == 0:
+            del terms[:]
+        elif c != 1:
+            mulrow = self.field.multable[c]
+            if self.field.m == 8:
+                terms[:] = terms.translate(mulrow)
+            else:
+                for i, t in enumerate(terms):
+                    terms[i] = mulrow[t]
+        return self
+
+    def shift(self, n):
+        """Multiplies by x^n in place, or for negative n divides by x^-n and
+        drops the remainder. Returns self."""
+        if not self.terms:
+            return self
+        if n > 0:
+            self.terms[0:0] = self._zeros(n)
+        elif n < 0:
+            del self.terms[:-n]
+        return self
+
+    def __mul__(self, other):
+        """Multiplies in the log domain: the logs of the non-zero terms of
+        other are looked up once, and then each term of the product is an
+        xor of exptable[log(a_i) + log(b_j)] over every pair of non-zero
+        terms with i + j equal to its power."""
+        a = self.terms
+        b = other.terms
+        if not a or not b:
+            return self._new(self._zeros(0))
+        field = self.field
+        exptable = field.exptable
+        logtable = field.logtable
+
+        loga = [(i, logtable[c]) for i, c in enumerate(a) if c]
+        logb = [(j, logtable[c]) for j, c in enumerate(b) if c]
+        if len(loga) < len(logb):
+            loga, logb = logb, loga
+        if numpy is not None and len(logb) >= numpy_mul_threshold:
+            return self._new(self._numpy_mul(loga, logb,
+                len(a) + len(b) - 1))
+
+        out = self._zeros(len(a) + len(b) - 1)
+        for i, la in loga:
+            for j, lb in logb:
+                out[i+j] ^= exptable[la + lb]
+        return self._new(out)
+
+    def _numpy_mul(self, loga, logb, length):
+        """The log domain product with one vectorized row per non-zero term
+        of a. Returns the terms."""
+        exptable = self.field.numpy_tables()[0]
+        positions = numpy.array([j for j, lb in logb], dtype=numpy.intp)
+        logs = numpy.array([lb for j, lb in logb], dtype=numpy.intp)
+        out = numpy.zeros(length, dtype=exptable.dtype)
+        for i, la in loga:
+            out[positions + i] ^= exptable[logs + la]
+        if self.field.m > 8:
+            return array("H", out.astype(numpy.uint16).tolist())
+        return bytearray(out.astype(numpy.uint8).tobytes())
+
+    def __divmod__(dividend, divisor):
+        """Long division, from the highest term down, on a copy of the
+        dividend. Returns the quotient and the remainder."""
+        d = divisor.terms
+        if not d:
+            raise ZeroDivisionError("Polynomial division by zero")
+        field = dividend.field
+        terms = dividend.terms[:]
+        shift = len(terms) - len(d)
+        if shift < 0:
+            return dividend._new(dividend._zeros(0)), dividend.copy()
+
+        quotient = dividend._zeros(shift + 1)
+        multable = field.multable
+        inverse = field.inverse(d[-1])
+        tail = range(len(d) - 1)
+        for i in xrange(shift, -1, -1):
+            c = terms[i + len(d) - 1]
+            if c:
+                q = multable[c][inverse]
+                quotient[i] = q
+                mulrow = multable[q]
+                for j in tail:
+                    terms[i+j] ^= mulrow[d[j]]
+        del terms[len(d) - 1:]
+        remainder = dividend._new(terms)
+        remainder._trim()
+        return dividend._new(quotient), remainder
+
+    def __floordiv__(self, other):
+        return divmod(self, other)[0]
+    def __mod__(self, other):
+        return divmod(self, other)[1]
+
+    def evaluate(self, x):
+        "Evaluate this polynomial at value x, returning the result."
+        return self.field.poly_eval(reversed(self.terms), x)
+
+    def evaluate_many(self, points):
+        """Evaluates this polynomial at each of a sequence of points, and
+        returns the results as a list.
+
+        This is Horner's method for every point at once. With NumPy the
+        points are one array, and each step is a single gather from the
+        product table (or the log tables, for fields over 8 bits) for all of
+        them. Without it, each point gets its own product table row, or its
+        log for fields over 8 bits, looked up once for the whole evaluation.
+        """
+        terms = self.terms
+        field = self.field
+        if not terms:
+            return [0] * len(points)
+        if numpy is not None:
+            return self._numpy_evaluate_many(points)
+
+        results = []
+        if field.m <= 8:
+            multable = field.multable
+            for x in points:
+                mulrow = multable[x]
+                y = 0
+                for c in reversed(terms):
+                    y = mulrow[y] ^ c
+                results.append(y)
+            return results
+
+        exptable = field.exptable
+        logtable = field.logtable
+        for x in points:
+            if x == 0:
+                results.append(terms[0])
+                continue
+            lx = logtable[x]
+            y = 0
+            for c in reversed(terms):
+                if y:
+                    y = exptable[logtable[y] + lx] ^ c
+                else:
+                    y = c
+            results.append(y)
+        return results
+
+    def _numpy_evaluate_many(self, points):
+        exptable, logtable, products = self.field.numpy_tables()
+        x = numpy.asarray(points, dtype=numpy.intp)
+        y = numpy.zeros(len(x), dtype=numpy.intp)
+        if products is not None:
+            for c in reversed(self.terms):
+                y = products[y, x]
+                y ^= c
+            return y.tolist()
+
+        lx = logtable[x]
+        nonzero_x = x != 0
+        for c in reversed(self.terms):
+            nonzero = (y != 0) & nonzero_x
+            y = numpy.where(nonzero, exptable[logtable[y] + lx], 0)
+            y ^= c
+        return y.tolist()
+
+    def __repr__(self):
+        return "GFPolynomial(%r, %r)" % (list(self.terms), self.field)
+    def __str__(self):
+        return str(self.to_polynomial())
@@ -1,6 +1,8 @@
 import unittest
 
-from polynomial import Polynomial
+import polynomial
+from polynomial import Polynomial, GFPolynomial
+import ff
 from ff import GF256int
 
 class TestGFPoly(unittest.TestCase):
@@ -62,6 +64,32 @@ class TestGFPoly(unittest.TestCase):
                 a // Polynomial(x0=scalar.inverse())
                 )
 
+    def test_div_long(self):
+        """Long divisions used to recurse once per quotient term"""
+        dividend = Polynomial(GF256int(x % 256) for x in xrange(1, 3001))
+        divisor = Polynomial(map(GF256int, (1, 3, 7)))
+        q, r = divmod(dividend, divisor)
+        self.assertEqual(q.degree(), 2997)
+        self.assertEqual(q*divisor + r, dividend)
+
+    def test_div_nonmonic(self):
+        one = Polynomial(map(GF256int, (5,3,1,1,6,8)))
+        two = Polynomial(map(GF256int, (9,4,2)))
+        q, r = divmod(one, two)
+        self.assertTrue(r.degree() < two.degree())
+        self.assertEqual(q*two + r, one)
+
+    def test_wide_field(self):
+        """Polynomials work the same over other fields"""
+        element = ff.field(16).element
+        one = Polynomial(map(element, (50000, 3, 1, 1, 6, 8)))
+        two = Polynomial(map(element, (9, 40000, 2)))
+        q, r = divmod(one, two)
+        self.assertTrue(r.degree() < two.degree())
+        self.assertEqual(q*two + r, one)
+        self.assertEqual(one.evaluate(element(2)) * two.evaluate(element(2)),
+                (one * two).evaluate(element(2)))
+
 
 
 class TestPolynomial(unittest.TestCase):
@@ -151,5 +179,104 @@ class TestPolynomial(unittest.TestCase):
         self.assertEqual(p.get_coefficient(8), 9)
         self.assertEqual(p.get_coefficient(9), 0)
 
+class TestGFPolynomial(unittest.TestCase):
+    """Tests GFPolynomial against Polynomial of GF256int objects"""
+    def setUp(self):
+        self.one = GFPolynomial((1, 5, 3, 8))
+        self.two = GFPolynomial((8, 6, 1, 1, 3, 5))
+        self.pone = Polynomial(map(GF256int, (8, 3, 5, 1)))
+        self.ptwo = Polynomial(map(GF256int, (5, 3, 1, 1, 6, 8)))
+
+    def test_convert(self):
+        self.assertEqual(self.pone, self.one.to_polynomial())
+        self.assertEqual(self.one, GFPolynomial.from_polynomial(self.pone))
+        self.assertEqual((1, 5, 3, 8, 0, 0), tuple(self.one[i]
+            for i in xrange(6)))
+        self.assertEqual(3, self.one.degree())
+        # Zero terms at the end don't count
+        self.assertEqual(self.one, GFPolynomial((1, 5, 3, 8, 0, 0)))
+        self.assertEqual(0, GFPolynomial((0, 0)).degree())
+
+    def test_arithmetic(self):
+        self.assertEqual(self.pone + self.ptwo,
+                (self.one + self.two).to_polynomial())
+        self.assertEqual(self.pone * self.ptwo,
+                (self.one * self.two).to_polynomial())
+        q, r = divmod(self.two, self.one)
+        self.assertEqual((101, 152, 11), q.to_polynomial().coefficients)
+        self.assertEqual((183, 185, 3), r.to_polynomial().coefficients)
+        self.assertEqual(self.ptwo.evaluate(GF256int(7)),
+                self.two.evaluate(7))
+
+    def test_inplace(self):
+        p = self.one.copy()
+        p.iadd(self.two)
+        self.assertEqual(self.one + self.two, p)
+        p += self.two
+        self.assertEqual(self.one, p)
+        # Cancelling the top terms lowers the degree
+        p.iadd(GFPolynomial((0, 0, 3, 8)))
+        self.assertEqual(GFPolynomial((1, 5)), p)
+
+        p = self.one.copy().imul_scalar(9)
+        self.assertEqual(self.pone * Polynomial(x0=GF256int(9)),
+                p.to_polynomial())
+        self.assertEqual(GFPolynomial(), p.imul_scalar(0))
+
+        p = self.one.copy().shift(2)
+        self.assertEqual(self.pone * Polynomial(x2=GF256int(1)),
+                p.to_polynomial())
+        self.assertEqual(self.one, p.shift(-2))
+        self.assertEqual(GFPolynomial((3, 8)), p.shift(-2))
+
+    def test_wide_field(self):
+        f = ff.field(16)
+        one = GFPolynomial((50000, 3, 1, 1, 6, 8), f)
+        two = GFPolynomial((9, 40000, 2), f)
+        q, r = divmod(one, two)
+        self.assertEqual(one, q * two + r)
+        self.assertEqual(one.to_polynomial() * two.to_polynomial(),
+                (one * two).to_polynomial())
+
+    def _without_numpy(self, f):
+        saved = polynomial.numpy
+        polynomial.numpy = None
+        try:
+            return f()
+        finally:
+            polynomial.numpy = saved
+
+    def test_mul_large(self):
+        """Big products are done with NumPy when it's there, and must match
+        the pure python ones and the product of each term"""
+        for f in (ff.GF256, ff.field(16)):
+            one = GFPolynomial([(i * 37 + 1) % f.size for i in xrange(100)], f)
+            two = GFPolynomial([(i * 91) % f.size for i in xrange(80)], f)
+            product = one * two
+            self.assertEqual(product, self._without_numpy(lambda: one * two))
+            # The coefficient of x^50 term by term
+            c = 0
+            for i in xrange(51):
+                c ^= f.mul(one[i], two[50-i])
+            self.assertEqual(c, product[50])
+            self.assertEqual(178, product.degree())
+
+    def test_evaluate_many(self):
+        for f in (ff.GF256, ff.field(16), ff.field(5, 0x25)):
+            p = GFPolynomial([(i * 29 + 3) % f.size for i in xrange(20)], f)
+            points = [0, 1, 2, f.size - 1, 7, 2]
+            expected = [p.evaluate(x) for x in points]
+            self.assertEqual(expected, p.evaluate_many(points))
+            self.assertEqual(expected,
+                    self._without_numpy(lambda: p.evaluate_many(points)))
+        self.assertEqual([0, 0], GFPolynomial().evaluate_many([3, 4]))
+
+        points = [GF256int(x) for x in (0, 1, 5, 200)]
+        self.assertEqual([self.pone.evaluate(x) for x in points],
+                self.pone.evaluate_many(points))
+        # Plain ints aren't field elements, so they're evaluated one by one
+        self.assertEqual([1, 3, 7], Polynomial((1, 1, 1)).evaluate_many(
+            [0, 1, 2]))
+
 if __name__ == "__main__":
     unittest.main()
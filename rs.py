@@ -2,9 +2,22 @@
 # Copyright (c) 2010 Andrew Brown <brownan@cs.duke.edu, brownan@gmail.com>
 # See LICENSE.txt for license terms
 
-from ff import GF256int
+import mmap
+import threading
+from array import array
+from collections import OrderedDict
+
+import ff
+import tablecache
 from polynomial import Polynomial
 
+# NumPy is optional. It is only used by the batch methods such as
+# encode_many(), which fall back to pure python without it.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 """This module implements Reed-Solomon Encoding.
 It supports arbitrary configurations for n and k, the codeword length and
 message length. This can be used to adjust the error correcting power of the
@@ -28,46 +41,145 @@ than 16 errors per block, your data will be recovered.
 """
 
 class RSCoder(object):
-    def __init__(self, n, k):
+    def __init__(self, n, k, field=None):
         """Creates a new Reed-Solomon Encoder/Decoder object configured with
         the given n and k values.
-        n is the length of a codeword, must be less than 256
+        n is the length of a codeword, must be less than the field size
         k is the length of the message, must be less than n
 
         The code will have error correcting power s where 2s = n - k
 
+        field is the ff.Field the code works over, GF(2^8) (the one GF256int
+        uses) by default. With a bigger field such as ff.field(16), codewords
+        can be up to 2^m - 1 symbols long.
+
         The typical RSCoder is RSCoder(255, 223)
         """
+        if field is None:
+            field = ff.GF256
         if n < 0 or k < 0:
             raise ValueError("n and k must be positive")
-        if not n < 256:
-            raise ValueError("n must be at most 255")
+        if not n < field.size:
+            raise ValueError("n must be at most %d" % field.order)
         if not k < n:
             raise ValueError("Codeword length n must be greater than message"
                     " length k")
         self.n = n
         self.k = k
+        self.field = field
+
+        # Symbols are bytes in a bytearray for fields of up to 8 bits, and
+        # ints in an array for bigger ones. The byte string and buffer
+        # methods only make sense for GF(2^8) itself.
+        self._wide = field.m > 8
+        self._bytewise = field.m == 8
+        self._multable = multable = field.multable
+        self._invtable = field.invtable
+        alpha = field.generator
 
         # Generate the generator polynomial for RS codes
         # g(x) = (x-α^1)(x-α^2)...(x-α^(n-k))
-        # α is 3, a generator for GF(2^8)
-        g = Polynomial((GF256int(1),))
-        for alpha in xrange(1,n-k+1):
-            p = Polynomial((GF256int(1), GF256int(3)**alpha))
-            g = g * p
-        self.g = g
-
-        # h(x) = (x-α^(n-k+1))...(x-α^n)
-        h = Polynomial((GF256int(1),))
-        for alpha in xrange(n-k+1,n+1):
-            p = Polynomial((GF256int(1), GF256int(3)**alpha))
+        # α is the field's generator, 3 for GF(2^8)
+        # This is done on plain ints with the field's tables. self.gen holds
+        # the coefficients in order of decreasing power, self.g is the same
+        # thing as a Polynomial of field elements.
+        gen = [1]
+        for l in xrange(1,n-k+1):
+            mulrow = multable[field.pow(alpha, l)]
+            gen.append(0)
+            for i in xrange(len(gen)-1, 0, -1):
+                gen[i] ^= mulrow[gen[i-1]]
+        self.gen = tuple(gen)
+
+        # Powers of α for 0 <= l <= n
+        self.alpha_powers = tuple(field.pow(alpha, l) for l in xrange(n+1))
+        # Product table rows for multiplying by α^l for 1 <= l <= n-k, used
+        # to compute the syndromes
+        self.syndrome_rows = tuple(multable[self.alpha_powers[l]]
+                for l in xrange(1, n-k+1))
+
+        # Per-thread scratch space for encode_into and decode_into
+        self._local = threading.local()
+        self._zeros = self._new(n-k)
+
+    @property
+    def g(self):
+        """The generator polynomial as a Polynomial of field elements. Only
+        encode(poly=True) uses it, so it's built when first asked for."""
+        try:
+            return self._g
+        except AttributeError:
+            pass
+        self._g = Polynomial(self.field.element(x) for x in self.gen)
+        return self._g
+
+    @property
+    def h(self):
+        """h(x) = (x-α^(n-k+1))...(x-α^n)
+
+        Nothing uses this, so it's only built when asked for. That takes k
+        polynomial multiplies, which is a long time for big fields.
+        """
+        try:
+            return self._h
+        except AttributeError:
+            pass
+        element = self.field.element
+        alpha = element(self.field.generator)
+        h = Polynomial((element(1),))
+        for l in xrange(self.n-self.k+1,self.n+1):
+            p = Polynomial((element(1), alpha**l))
             h = h * p
-        self.h = h
-
-        # g*h is used in verification, and is always x^n-1
-        # TODO: This is hardcoded for (255,223)
-        # But it doesn't matter since my verify method doesn't use it
-        self.gtimesh = Polynomial(x255=GF256int(1), x0=GF256int(1))
+        self._h = h
+        return h
+
+    @property
+    def gtimesh(self):
+        """g*h could be used in verification, and is x^n-1 when n is the full
+        length 2^m-1 of the field. My verify method doesn't use it."""
+        element = self.field.element
+        return Polynomial(**{"x%d" % self.n: element(1), "x0": element(1)})
+
+    def _new(self, size):
+        """Returns a new buffer of size zero symbols"""
+        if self._wide:
+            return array("H", [0]) * size
+        return bytearray(size)
+
+    def _symbols(self, data, mask=False):
+        """Copies data, a string or buffer of bytes or (for fields over 8
+        bits) a sequence of ints, into a new buffer of symbols. Raises
+        ValueError if a symbol is too big for the field, or if mask is True
+        cuts it down to the field size. A received symbol that's out of range
+        was damaged anyway, and the decoder will correct it like any other
+        error."""
+        if self._wide:
+            if isinstance(data, basestring):
+                raise TypeError("Symbols of GF(2^%d) are given as a sequence"
+                        " of ints" % self.field.m)
+            data = array("H", data)
+        else:
+            data = bytearray(data)
+        if not self._bytewise and data and max(data) > self.field.order:
+            if not mask:
+                raise ValueError("Symbols of GF(2^%d) are at most %d" %
+                        (self.field.m, self.field.order))
+            top = self.field.order
+            for i, x in enumerate(data):
+                data[i] = x & top
+        return data
+
+    def _output(self, symbols):
+        """Returns a buffer of symbols in the form encode() and decode() give
+        them back: a string for fields of up to 8 bits, an array of ints for
+        bigger ones"""
+        if self._wide:
+            return symbols
+        return str(symbols)
+
+    def _check_bytewise(self):
+        if not self._bytewise:
+            raise TypeError("This method only works with codes over GF(2^8)")
 
     def encode(self, message, poly=False):
         """Encode a given string with reed-solomon encoding. Returns a byte
@@ -80,6 +192,10 @@ class RSCoder(object):
 
         If poly is not False, returns the encoded Polynomial object instead of
         the polynomial translated back to a string (useful for debugging)
+
+        The string is computed with a shift register over precomputed
+        generator coefficients (see _parity). Only poly=True goes through the
+        Polynomial class.
         """
         n = self.n
         k = self.k
@@ -88,11 +204,19 @@ class RSCoder(object):
             raise ValueError("Message length is max %d. Message was %d" % (k,
                 len(message)))
 
+        message = self._symbols(message)
+        if not poly:
+            # Fast path: compute the parity bytes directly with a shift
+            # register and never build a Polynomial
+            message = self._new(k - len(message)) + message
+            return self._output(message + self._parity(message))
+
         # Encode message as a polynomial:
-        m = Polynomial(GF256int(ord(x)) for x in message)
+        element = self.field.element
+        m = Polynomial(element(x) for x in message)
 
         # Shift polynomial up by n-k by multiplying by x^(n-k)
-        mprime = m * Polynomial((GF256int(1),) + (GF256int(0),)*(n-k))
+        mprime = m * Polynomial((element(1),) + (element(0),)*(n-k))
 
         # mprime = q*g + b for some q
         # so let's find b:
@@ -103,32 +227,530 @@ class RSCoder(object):
         # Since c is a multiple of g, it has (at least) n-k roots: α^1 through
         # α^(n-k)
 
-        if poly:
-            return c
-
-        # Turn the polynomial c back into a byte string
-        return "".join(chr(x) for x in c.coefficients).rjust(n, "\0")
+        return c
 
-    def verify(self, code):
-        """Verifies the code is valid by testing that the code as a polynomial
-        code divides g
-        returns True/False
+    def _parity(self, message):
+        """Computes the n-k parity bytes for a message given as a bytearray of
+        exactly k bytes. Returns them as a bytearray (or an array, for fields
+        over 8 bits).
+        """
+        buf = message + self._new(self.n - self.k)
+        self._lfsr(buf)
+        return buf[self.k:]
+
+    def _lfsr(self, buf):
+        """buf is a bytearray of n bytes holding a message in its first k
+        bytes and zeros in the rest. Computes the parity bytes into the last
+        n-k bytes of buf. The first k bytes are overwritten in the process.
+
+        This is the same as mprime % g in the polynomial version of encode(),
+        done as synthetic division on a single buffer. This is the software
+        version of the usual linear feedback shift register encoder: each
+        message byte is xored into the top of the register and the feedback
+        is multiplied by the generator coefficients into the rest of it.
+        """
+        gen = self.gen
+        multable = self._multable
+        taps = xrange(1, self.n - self.k + 1)
+
+        for i in xrange(self.k):
+            feedback = buf[i]
+            if feedback:
+                mulrow = multable[feedback]
+                for j in taps:
+                    buf[i+j] ^= mulrow[gen[j]]
+
+    def _scratch(self):
+        """Returns a bytearray of n bytes for working on one codeword. There is
+        one per thread, kept for the life of the coder, so the *_into methods
+        don't allocate a new buffer for every block."""
+        try:
+            return self._local.buf
+        except AttributeError:
+            self._local.buf = bytearray(self.n)
+            return self._local.buf
+
+    def encode_into(self, src, dst):
+        """Encodes the k byte message in the buffer src (a string, bytearray,
+        memoryview, mmap or anything else supporting the buffer protocol)
+        into the writable buffer dst.
+
+        If dst is n bytes long, the whole codeword is written into it. If it
+        is n-k bytes long, only the parity bytes are. src may be the first k
+        bytes of dst itself.
         """
         n = self.n
         k = self.k
-        h = self.h
-        g = self.g
+        self._check_bytewise()
+        if len(src) != k:
+            raise ValueError("Message must be exactly %d bytes" % k)
+
+        buf = self._scratch()
+        buf[:k] = src
+        buf[k:] = self._zeros
+        self._lfsr(buf)
+        # The division leaves the quotient, not the message, in buf[:k]
+        buf[:k] = src
+
+        if len(dst) == n:
+            _store(dst, 0, buf)
+        elif len(dst) == n - k:
+            _store(dst, 0, memoryview(buf)[k:])
+        else:
+            raise ValueError("Destination must be %d or %d bytes" % (n, n-k))
+
+    def decode_into(self, src, dst=None, erasures=None):
+        """Decodes the n byte codeword in the buffer src (a string, bytearray,
+        memoryview, mmap or anything else supporting the buffer protocol).
 
-        c = Polynomial(GF256int(ord(x)) for x in code)
+        If dst is None, src must be writable and is repaired in place. It is
+        only written to if there were errors to correct. Otherwise dst is a
+        writable buffer of either k bytes, which receives the message, or n
+        bytes, which receives the corrected codeword.
 
-        # This works too, but takes longer. Both checks are just as valid.
-        #return (c*h)%gtimesh == Polynomial(x0=0)
+        erasures optionally lists known bad positions, as with decode().
 
-        # Since all codewords are multiples of g, checking that code divides g
-        # suffices for validating a codeword.
-        return c % g == Polynomial(x0=0)
+        Returns 0 if the codeword was valid, the number of bytes corrected,
+        or -1 if the errors could not be corrected, in which case nothing is
+        written to src and the received data is written to dst.
+        """
+        n = self.n
+        k = self.k
+        self._check_bytewise()
+        if len(src) != n:
+            raise ValueError("Codeword must be exactly %d bytes" % n)
+        erasures = self._check_erasures(erasures)
+
+        buf = self._scratch()
+        buf[:] = src
+        s = self.syndromes(buf)
+        if any(s):
+            count = self._correct(buf, self._syndrome_polynomial(s),
+                    erasures)
+        else:
+            count = 0
+
+        if dst is None:
+            if count > 0:
+                _store(src, 0, buf)
+        elif len(dst) == k:
+            _store(dst, 0, memoryview(buf)[:k])
+        elif len(dst) == n:
+            _store(dst, 0, buf)
+        else:
+            raise ValueError("Destination must be %d or %d bytes" % (k, n))
+        return count
+
+    def parity_matrix(self):
+        """Returns the systematic parity matrix of this code as a list of k
+        bytearrays of n-k bytes each (arrays of ints for fields over 8 bits).
+        Row i is the parity of the message with a 1 in position i and 0
+        everywhere else.
+
+        Encoding is linear, so the parity of any message is the sum (xor) of
+        its bytes times their rows. The matrix is computed on first use and
+        kept.
+
+        Row i is x^(n-1-i) mod g. The last row, x^(n-k) mod g, is just the
+        generator coefficients after the leading 1, and each row before it is
+        the one after it times x, mod g: a shift and at most one multiple of
+        the generator. So the whole matrix takes about k*(n-k) operations
+        instead of k encodes.
+        """
+        try:
+            return self._parity_matrix
+        except AttributeError:
+            pass
+        k = self.k
+        gen = self.gen
+        taps = xrange(self.n - k)
+        # Multiplying a row by x shifts it up and brings in a zero constant
+        # term
+        zero = self._new(1)
+
+        row = self._symbols(gen[1:])
+        rows = [row]
+        for i in xrange(k-1):
+            top = row[0]
+            row = row[1:] + zero
+            if top:
+                mulrow = self._multable[top]
+                for j in taps:
+                    row[j] ^= mulrow[gen[j+1]]
+            rows.append(row)
+        rows.reverse()
+        self._parity_matrix = rows
+        return rows
+
+    def _parity_tables(self):
+        """Returns a NumPy array of shape (k, 256, n-k) where
+        [i, b] is the parity contribution of byte value b in message position
+        i. That is, the product table gathered at parity matrix row i.
+        The array is read-only, and may come from the table cache.
+        """
+        try:
+            return self._parity_table_array
+        except AttributeError:
+            pass
+        def build():
+            mt = numpy.array([numpy.frombuffer(bytes(row), dtype=numpy.uint8)
+                for row in self._multable])
+            pm = numpy.array([numpy.frombuffer(bytes(row),
+                dtype=numpy.uint8) for row in self.parity_matrix()])
+            # mt[:, pm[i]] is, for every byte value b, the row pm[i] times b
+            return mt[:, pm].transpose(1, 0, 2).tobytes()
+        self._parity_table_array = self._cached_table("parity", build,
+                (self.k, 256, self.n - self.k))
+        return self._parity_table_array
+
+    def encode_many(self, messages):
+        """Encodes many messages at once. messages is either a 2-D array of
+        shape (N, k) (anything numpy.asarray will take, such as a list of
+        k byte strings), or one long byte string or buffer whose length is a
+        multiple of k, which is split into k byte rows.
+
+        Unlike encode(), every message must be exactly k bytes long.
+
+        With NumPy installed, the parity for all rows is computed together
+        from the parity matrix and an (N, n) uint8 array of codewords is
+        returned. Without NumPy this falls back to calling encode() on each
+        row and returns a list of N codeword strings.
+        """
+        k = self.k
+        n = self.n
+        self._check_bytewise()
+
+        if numpy is None:
+            return [self.encode(m) for m in _split_rows(messages, k)]
+
+        messages = _as_array(messages, k)
+
+        out = numpy.zeros((messages.shape[0], n), dtype=numpy.uint8)
+        out[:, :k] = messages
+        parity = out[:, k:]
+        tables = self._parity_tables()
+        for i in xrange(k):
+            # One gather and one xor per message column, across all rows
+            parity ^= tables[i][messages[:, i]]
+        return out
+
+    def update_parity(self, codeword, offset, old_bytes, new_bytes):
+        """Updates the parity of a codeword after some of its message bytes
+        change, without re-encoding it. old_bytes are the message bytes
+        starting at offset as they were, and new_bytes what they become.
+
+        Encoding is linear, so the parity changes by the sum of
+        (old_i xor new_i) times the parity matrix row for each changed
+        position. The cost is proportional to the number of bytes that
+        actually changed.
+
+        If codeword is a writable buffer, the new bytes and the new parity are
+        written into it and it is returned. If it's a string, a new string is
+        returned.
+        """
+        n = self.n
+        k = self.k
+        self._check_bytewise()
+        if len(codeword) != n:
+            raise ValueError("Codeword must be exactly %d bytes" % n)
+        if len(old_bytes) != len(new_bytes):
+            raise ValueError("old_bytes and new_bytes must be the same length")
+        if offset < 0 or offset + len(new_bytes) > k:
+            raise ValueError("Changes must be within the %d message bytes" % k)
+
+        rows = self.parity_matrix()
+        multable = self._multable
+        delta = bytearray(n - k)
+        taps = xrange(n - k)
+        for i, (old, new) in enumerate(zip(bytearray(old_bytes),
+                bytearray(new_bytes))):
+            if old != new:
+                mulrow = multable[old ^ new]
+                row = rows[offset + i]
+                for j in taps:
+                    delta[j] ^= mulrow[row[j]]
+
+        if isinstance(codeword, str):
+            codeword = bytearray(codeword)
+            writable = False
+        else:
+            writable = True
+        parity = bytearray(codeword[k:])
+        for j in taps:
+            parity[j] ^= delta[j]
+        _store(codeword, offset, bytearray(new_bytes))
+        _store(codeword, k, parity)
+
+        if writable:
+            return codeword
+        return str(codeword)
+
+    def update_parity_many(self, codes, rows, positions, new_values):
+        """Batched update_parity. codes is a writable (N, n) uint8 NumPy array
+        of codewords, or without NumPy a list of bytearrays. rows, positions
+        and new_values are sequences of the same length, each entry setting
+        message byte positions[i] of codeword rows[i] to new_values[i]. The
+        codewords are updated in place. A given byte must not be changed more
+        than once in the same call.
+        """
+        k = self.k
+        self._check_bytewise()
+        if not len(rows) == len(positions) == len(new_values):
+            raise ValueError("rows, positions and new_values must be the same"
+                    " length")
+
+        if numpy is None:
+            for row, position, value in zip(rows, positions, new_values):
+                code = codes[row]
+                self.update_parity(code, position, code[position:position+1],
+                        bytearray((value,)))
+            return
+
+        rows = numpy.asarray(rows, dtype=numpy.intp)
+        positions = numpy.asarray(positions, dtype=numpy.intp)
+        new_values = numpy.asarray(new_values, dtype=numpy.uint8)
+        if len(positions) and (positions.min() < 0 or positions.max() >= k):
+            raise ValueError("Changes must be within the %d message bytes" % k)
+
+        delta = codes[rows, positions] ^ new_values
+        # The parity contribution of each change, all gathered at once
+        contributions = self._parity_tables()[positions, delta]
+        codes[rows, positions] = new_values
+        # Several changes may land in the same codeword, so the xors have to
+        # be unbuffered
+        parity = codes[:, k:]
+        numpy.bitwise_xor.at(parity, rows, contributions)
+
+    def _syndrome_tables(self):
+        """Returns a NumPy array of shape (n, 256, n-k) where [i, b, l-1] is
+        the contribution of byte value b at codeword position i to the
+        syndrome s_l, that is b * α^(l*(n-1-i)).
+        """
+        try:
+            return self._syndrome_table_array
+        except AttributeError:
+            pass
+        n = self.n
+        nk = n - self.k
+        def build():
+            mt = numpy.array([numpy.frombuffer(bytes(row), dtype=numpy.uint8)
+                for row in self._multable])
+            alpha = self.field.generator
+            H = numpy.array([[self.field.pow(alpha, l*(n-1-i))
+                for l in xrange(1, nk+1)]
+                for i in xrange(n)], dtype=numpy.intp)
+            return mt[:, H].transpose(1, 0, 2).tobytes()
+        self._syndrome_table_array = self._cached_table("syndrome", build,
+                (n, 256, nk))
+        return self._syndrome_table_array
+
+    def _cached_table(self, kind, build, shape):
+        """Returns a read-only uint8 NumPy array of the given shape, loaded
+        from the table cache or made by build() (see tablecache.load)"""
+        field = self.field
+        name = "%s-%d-%d-%d-%x-%d" % (kind, self.n, self.k, field.m,
+                field.poly, field.generator)
+        data = tablecache.load(name, build, numpy.prod(shape))
+        return numpy.frombuffer(data, dtype=numpy.uint8).reshape(shape)
+
+    def decode_many(self, codes, inplace=False):
+        """Decodes many n byte codewords at once. codes is either a 2-D array
+        of shape (N, n) (such as the output of encode_many) or one long byte
+        string or buffer whose length is a multiple of n.
+
+        Returns a tuple (messages, status). Messages are always k bytes long,
+        as with decode(r, nostrip=True). status has one entry per codeword:
+            0   the codeword was valid
+            >0  the number of bytes that were corrected
+            -1  the errors could not be corrected. The message is returned
+                as received.
+
+        With NumPy installed, the syndromes of all codewords are computed
+        together and only the codewords with a non-zero syndrome go through
+        the error correction procedure; valid codewords are not touched.
+        messages is an (N, k) uint8 array and status is an int array. If every
+        codeword is valid, messages is a view of the first k columns of codes
+        and nothing is copied. Otherwise codes is copied before correcting,
+        unless inplace is True and codes is a writable array, in which case
+        the corrections are written back into it.
+
+        Without NumPy, each codeword is checked and corrected in turn and
+        two lists are returned.
+        """
+        n = self.n
+        k = self.k
+        self._check_bytewise()
+
+        if numpy is None:
+            messages = []
+            status = []
+            for code in _split_rows(codes, n):
+                code = bytearray(code)
+                s = self.syndromes(code)
+                if any(s):
+                    count = self._correct(code, self._syndrome_polynomial(s))
+                else:
+                    count = 0
+                messages.append(str(code[:k]))
+                status.append(count)
+            return messages, status
+
+        codes = _as_array(codes, n)
+
+        # Syndrome triage: one gather and xor per codeword column
+        syndromes = numpy.zeros((codes.shape[0], n-k), dtype=numpy.uint8)
+        tables = self._syndrome_tables()
+        for i in xrange(n):
+            syndromes ^= tables[i][codes[:, i]]
+
+        status = numpy.zeros(codes.shape[0], dtype=numpy.int_)
+        bad = numpy.flatnonzero(syndromes.any(axis=1))
+        if len(bad) and not (inplace and codes.flags.writeable):
+            # Only copy when something may need correcting
+            codes = codes.copy()
+        for row in bad:
+            code = bytearray(codes[row].tobytes())
+            sz = self._syndrome_polynomial(syndromes[row])
+            status[row] = self._correct(code, sz)
+            if status[row] > 0:
+                codes[row] = numpy.frombuffer(bytes(code), dtype=numpy.uint8)
+
+        return codes[:, :k], status
+
+    def encode_stream(self, fileobj, chunk_blocks=1024):
+        """Encodes everything read from the file-like object fileobj, yielding
+        the encoded output lazily. Data is read chunk_blocks blocks at a time
+        and each chunk's codewords are yielded as one string, so memory use
+        does not depend on the size of the input.
+
+        Unlike encode(), a short final block is padded at the end, and the
+        output always ends with one extra trailer codeword whose message is
+        the number of data bytes in the last block. decode_stream() uses this
+        to return exactly the bytes that were encoded, so this is safe for
+        binary data.
+        """
+        k = self.k
+        self._check_bytewise()
+        last = 0
+        for chunk in read_chunks(fileobj, k * chunk_blocks):
+            full = len(chunk) - len(chunk) % k
+            if full:
+                yield self._encode_blocks(chunk if full == len(chunk)
+                        else buffer(chunk, 0, full))
+            if full != len(chunk):
+                # Only the last chunk can be short
+                yield self.encode(bytearray(chunk[full:]).ljust(k, "\0"))
+            last = len(chunk) - full or k
+
+        yield self.encode(chr(last))
+
+    def decode_stream(self, fileobj, chunk_blocks=1024):
+        """Decodes a stream produced by encode_stream() read from the
+        file-like object fileobj, yielding the decoded output lazily. Data is
+        read chunk_blocks codewords at a time.
+
+        Raises ValueError if the stream is not a whole number of codewords or
+        is missing its trailer, and IOError if a codeword has too many errors
+        to correct.
+        """
+        n = self.n
+        k = self.k
+        self._check_bytewise()
+
+        # The last two decoded blocks are held back until the end of the
+        # stream: the trailer, and the data block it describes
+        held = ""
+        offset = 0
+        for chunk in read_chunks(fileobj, n * chunk_blocks):
+            if len(chunk) % n:
+                raise ValueError("Stream length must be a multiple of %d" % n)
+            decoded = held + self._decode_blocks(chunk, offset)
+            offset += len(chunk)
+            if len(decoded) > 2*k:
+                yield decoded[:-2*k]
+                held = decoded[-2*k:]
+            else:
+                held = decoded
+
+        if not held:
+            raise ValueError("Stream is missing its trailer")
+        last = ord(held[-1])
+        if len(held) == k:
+            # Empty stream, nothing but the trailer
+            valid = last == 0
+        else:
+            valid = 0 < last <= k
+        if not valid:
+            raise ValueError("Stream has an invalid trailer")
+        if len(held) == 2*k:
+            yield held[:last]
+
+    def _encode_blocks(self, data):
+        """Encodes a buffer holding a whole number of k byte blocks, returning
+        the codewords as one string"""
+        if numpy is not None:
+            return self.encode_many(data).tobytes()
+        k = self.k
+        view = memoryview(data)
+        return "".join(self.encode(view[i:i+k])
+                for i in xrange(0, len(data), k))
+
+    def _decode_blocks(self, data, offset=0):
+        """Decodes a buffer holding a whole number of n byte codewords,
+        returning the k byte messages as one string. offset is where data
+        starts in the stream, for the error message. Raises IOError if a
+        codeword can't be corrected."""
+        n = self.n
+        if numpy is not None:
+            messages, status = self.decode_many(data)
+            bad = numpy.flatnonzero(status < 0)
+            if len(bad):
+                raise IOError("Codeword at offset %d could not be corrected"
+                        % (offset + int(bad[0]) * n))
+            return messages.tobytes()
+        view = memoryview(data)
+        message = bytearray(self.k)
+        messages = []
+        for i in xrange(0, len(data), n):
+            if self.decode_into(view[i:i+n], message) < 0:
+                raise IOError("Codeword at offset %d could not be corrected"
+                        % (offset + i))
+            messages.append(str(message))
+        return "".join(messages)
+
+    def syndromes(self, code):
+        """Computes the syndromes of the received codeword code (a string,
+        bytearray or other buffer). Returns a list of the n-k values s_1
+        through s_(n-k), where s_l is the codeword as a polynomial evaluated
+        at α^l.
+
+        A codeword is valid exactly when all of its syndromes are 0, so this
+        doubles as an integrity check. Non-zero syndromes are what the decoder
+        works from to locate and correct the errors.
+        """
+        if not self._bytewise:
+            code = self._symbols(code, mask=True)
+        elif not isinstance(code, bytearray):
+            code = bytearray(code)
+        s = []
+        # Horner's method for each α^l, using the precomputed product table
+        # rows for multiplying by α^l
+        for mulrow in self.syndrome_rows:
+            y = 0
+            for c in code:
+                y = mulrow[y] ^ c
+            s.append(y)
+        return s
 
-    def decode(self, r, nostrip=False):
+    def verify(self, code):
+        """Verifies the code is valid by testing that all of its syndromes are
+        0. This is the same as testing that the code as a polynomial divides
+        g, since g's roots are exactly the α^l the syndromes are evaluated at.
+        returns True/False
+        """
+        return not any(self.syndromes(code))
+
+    def decode(self, r, nostrip=False, erasures=None):
         """Given a received string or byte array r, attempts to decode it. If
         it's a valid codeword, or if there are no more than (n-k)/2 errors, the
         message is returned.
@@ -138,87 +760,191 @@ class RSCoder(object):
         stripped, but that can cause problems if decoding binary data. When
         nostrip is True, messages returned are always k bytes long. This is
         useful to make sure no data is lost when decoding binary data.
+
+        erasures is an optional list of positions in the codeword (indices
+        into the n bytes) that are known to be bad, such as failed sector
+        reads. Up to n-k erasures can be corrected, or in general e unknown
+        errors along with f erasures as long as 2e + f <= n-k.
         """
         n = self.n
         k = self.k
+        erasures = self._check_erasures(erasures)
+
+        # A codeword shorter than n is assumed to be padded at the front
+        r = self._symbols(r, mask=True)
+        r = self._new(n - len(r)) + r
+
+        # Compute the syndromes. If they're all 0, r is a valid codeword and
+        # there's nothing more to do
+        s = self.syndromes(r)
+        if any(s):
+            # Find and correct the errors in r. This uses the
+            # Berlekamp-Massey algorithm to find the error locator and error
+            # evaluator polynomials, Chien's procedure to find the error
+            # locations, and Forney's formula for the error magnitudes.
+            self._correct(r, self._syndrome_polynomial(s), erasures)
+
+        # The last n-k bytes are parity
+        message = r[:k]
+        if not nostrip:
+            start = 0
+            while start < k and not message[start]:
+                start += 1
+            message = message[start:]
+        return self._output(message)
+
+    def _check_erasures(self, erasures):
+        """Validates a list of erasure positions, returning it as a sorted
+        list without duplicates"""
+        if not erasures:
+            return []
+        erasures = sorted(set(erasures))
+        if erasures[0] < 0 or erasures[-1] >= self.n:
+            raise ValueError("Erasure positions must be between 0 and %d" %
+                    (self.n - 1))
+        if len(erasures) > self.n - self.k:
+            raise ValueError("At most %d erasures can be corrected" %
+                    (self.n - self.k))
+        return erasures
+
+    def _correct(self, code, sz, erasures=None):
+        """Corrects the received codeword code, a bytearray of n bytes, in
+        place. sz is its syndrome polynomial as returned by
+        _syndrome_polynomial, and must not be zero. erasures optionally lists
+        positions in code (as indices into it) that are known to be bad, see
+        _correct_erasures.
+
+        Returns the number of bytes corrected, or -1 if the errors could not
+        be located. In that case code is left untouched.
+        """
+        if erasures:
+            return self._correct_erasures(code, sz, erasures)
 
-        if self.verify(r):
-            # The last n-k bytes are parity
-            if nostrip:
-                return r[:-(n-k)]
-            else:
-                return r[:-(n-k)].lstrip("\0")
-
-        # Turn r into a polynomial
-        r = Polynomial(GF256int(ord(x)) for x in r)
-
-        # Compute the syndromes:
-        sz = self._syndromes(r)
-
-        # Find the error locator polynomial and error evaluator polynomial
-        # using the Berlekamp-Massey algorithm
+        n = self.n
         sigma, omega = self._berlekamp_massey(sz)
+        if not 0 < sigma.degree() <= (n - self.k) // 2:
+            return -1
 
-        # Now use Chien's procedure to find the error locations
-        # j is an array of integers representing the positions of the errors, 0
-        # being the rightmost byte
-        # X is a corresponding array of GF(2^8) values where X_i = alpha^(j_i)
         X, j = self._chien_search(sigma)
-
-        # And finally, find the error magnitudes with Forney's Formula
-        # Y is an array of GF(2^8) values corresponding to the error magnitude
-        # at the position given by the j array
-        Y = self._forney(omega, X)
-
-        # Put the error and locations together to form the error polynomial
-        Elist = []
-        for i in xrange(255):
-            if i in j:
-                Elist.append(Y[j.index(i)])
-            else:
-                Elist.append(GF256int(0))
-        E = Polynomial(reversed(Elist))
-
-        # And we get our real codeword!
-        c = r - E
-
-        # Form it back into a string and return all but the last n-k bytes
-        ret = "".join(chr(x) for x in c.coefficients[:-(n-k)])
-        #                                            :-(
-
-        if nostrip:
-            # Polynomial objects don't store leading 0 coefficients, so we
-            # actually need to pad this to k bytes
-            return ret.rjust(k, "\0")
-        else:
-            return ret
-
-
-    def _syndromes(self, r):
-        """Given the received codeword r in the form of a Polynomial object,
-        computes the syndromes and returns the syndrome polynomial
+        # Every root of sigma must be found, and every error must land inside
+        # the codeword. Otherwise there were more errors than we can correct.
+        if len(j) != sigma.degree() or max(j) >= n:
+            return -1
+
+        Y = self._forney(omega, X, sigma)
+        if Y is None:
+            return -1
+        for position, magnitude in zip(j, Y):
+            code[n-1-position] ^= magnitude
+        return len(j)
+
+    def _correct_erasures(self, code, sz, erasures):
+        """Like _correct, but with a list of erasures: positions in code that
+        are known to be bad. With f erasures, up to e unknown errors can also
+        be corrected as long as 2e + f <= n-k.
+
+        The erasure locator
+        Gamma(z) = Product( 1 - X_i * z ) over the erasure locations X_i
+        is known up front. Multiplying it into the syndromes gives the Forney
+        syndromes, n-k-f of them, in which the erasures have cancelled out:
+        T_l = sum( Gamma_j * s_(l+f-j), j=0..f )
+        Berlekamp-Massey on those finds the locator lambda for just the
+        unknown errors, so Chien's search only has to look for deg(lambda)
+        roots, and none at all if there are only erasures. The errata
+        locator is then psi = lambda * Gamma, the errata evaluator is
+        omega = (1 + s) * psi mod z^(n-k+1), and Forney's formula gives the
+        magnitudes for the errors and erasures together.
+
+        Returns the number of bytes changed, or -1 if the errors could not
+        be located. In that case code is left untouched.
         """
         n = self.n
-        k = self.k
-
-        # s[l] is the received codeword evaluated at α^l for 1 <= l <= s
-        # α in this implementation is 3
-        s = [GF256int(0)] # s[0] is 0 (coefficient of z^0)
-        for l in xrange(1, n-k+1):
-            s.append( r.evaluate( GF256int(3)**l ) )
-
-        # Now build a polynomial out of all our s[l] values
-        # s(z) = sum(s_i * z^i, i=1..inf)
-        sz = Polynomial( reversed( s ) )
-
-        return sz
+        nk = n - self.k
+        field = self.field
+        multable = self._multable
+
+        # Erasure positions in the same form as the j values from
+        # _chien_search
+        known = [n - 1 - i for i in erasures]
+        f = len(known)
+
+        # Gamma as plain ints in order of increasing power
+        gamma = [1]
+        for j in known:
+            mulrow = multable[field.pow(field.generator, j)]
+            gamma.append(0)
+            for i in xrange(len(gamma)-1, 0, -1):
+                gamma[i] ^= mulrow[gamma[i-1]]
+
+        # s[l] is syndrome s_l for 1 <= l <= n-k
+        s = [int(c) for c in reversed(sz.coefficients)]
+        s.extend([0] * (nk + 1 - len(s)))
+
+        # Forney syndromes T_1 through T_(n-k-f)
+        T = []
+        for l in xrange(1, nk - f + 1):
+            t = 0
+            for i, g in enumerate(gamma):
+                t ^= multable[g][s[l+f-i]]
+            T.append(t)
+
+        lam, _ = self._berlekamp_massey(self._syndrome_polynomial(T), nk - f)
+        if lam.degree() > (nk - f) // 2:
+            return -1
+        # Non-zero Forney syndromes mean there are unknown errors, so a
+        # constant lambda means they couldn't be located
+        if lam.degree() == 0 and any(T):
+            return -1
+        if lam.degree() > 0:
+            X, j = self._chien_search(lam)
+            # A root of lambda on an erasure makes it a double root of psi,
+            # which happens only when there were too many errors
+            if len(j) != lam.degree() or set(j) & set(known):
+                return -1
+        else:
+            X, j = [], []
+
+        element = field.element
+        psi = lam * Polynomial(element(c) for c in reversed(gamma))
+        ONE = Polynomial(z0=element(1))
+        omega = Polynomial(((ONE + sz) * psi).coefficients[-(nk+1):])
+
+        X = X + [element(field.pow(field.generator, position))
+                for position in known]
+        j = j + known
+        Y = self._forney(omega, X, psi)
+        if Y is None:
+            return -1
+
+        # Past 2e + f <= n-k the errata found can still be wrong without
+        # anything above noticing, so the result is checked before it's
+        # written back
+        fixed = code[:]
+        count = 0
+        for position, magnitude in zip(j, Y):
+            if magnitude:
+                fixed[n-1-position] ^= magnitude
+                count += 1
+        if any(self.syndromes(fixed)):
+            return -1
+        code[:] = fixed
+        return count
+
+    def _syndrome_polynomial(self, s):
+        """Given the list of syndromes as returned by syndromes(), returns the
+        syndrome polynomial
+        s(z) = sum(s_i * z^i, i=1..n-k)
+        """
+        # s[0] is 0 (coefficient of z^0)
+        element = self.field.element
+        return Polynomial( element(x) for x in reversed([0] + list(s)) )
 
-    def _berlekamp_massey(self, s):
+    def _berlekamp_massey(self, s, iterations=None):
         """Computes and returns the error locator polynomial (sigma) and the
         error evaluator polynomial (omega)
         The parameter s is the syndrome polynomial (syndromes encoded in a
-        generator function) as returned by _syndromes. Don't be confused with
-        the other s = (n-k)/2
+        generator function) as returned by _syndrome_polynomial. Don't be
+        confused with the other s = (n-k)/2
 
         Notes:
         The error polynomial:
@@ -239,134 +965,253 @@ class RSCoder(object):
         ( 1/X_1, 1/X_2, ...)
 
         Error evaluator polynomial omega(z) not written here
+
+        The algorithm runs once per syndrome, n-k times unless iterations
+        says otherwise (see _correct_erasures).
         """
-        n = self.n
-        k = self.k
+        if iterations is None:
+            nk = self.n - self.k
+        else:
+            nk = iterations
+
+        # All polynomials are kept as plain int lists in order of increasing
+        # power (index i holds the coefficient of z^i). None of them can grow
+        # past degree n-k+1, so they're allocated at that size up front and
+        # only the current iteration's values are kept, with sigma and omega
+        # double buffered so the previous ones are still available for rule B.
+        size = nk + 2
+        multable = self._multable
+        invtable = self._invtable
+
+        # S[i] is the coefficient of z^i in (1 + s)
+        S = [1] + [int(c) for c in reversed(s.coefficients[:-1])]
+        S.extend([0] * (nk + 1 - len(S)))
 
         # Initialize:
-        sigma =  [ Polynomial((GF256int(1),)) ]
-        omega =  [ Polynomial((GF256int(1),)) ]
-        tao =    [ Polynomial((GF256int(1),)) ]
-        gamma =  [ Polynomial((GF256int(0),)) ]
-        D =      [ 0 ]
-        B =      [ 0 ]
-
-        # Polynomial constants:
-        ONE = Polynomial(z0=GF256int(1))
-        ZERO = Polynomial(z0=GF256int(0))
-        Z = Polynomial(z1=GF256int(1))
-        
+        sigma = [1] + [0] * (size-1)
+        omega = [1] + [0] * (size-1)
+        tao =   [1] + [0] * (size-1)
+        gamma = [0] * size
+        D = 0
+        B = 0
+
+        sigma_next = [0] * size
+        omega_next = [0] * size
+        terms = xrange(1, size)
+
         # Iteratively compute the polynomials 2s times. The last ones will be
         # correct
-        for l in xrange(0, n-k):
-            # Goal for each iteration: Compute sigma[l+1] and omega[l+1] such that
-            # (1 + s)*sigma[l] == omega[l] in mod z^(l+1)
+        for l in xrange(0, nk):
+            # Goal for each iteration: Compute sigma[l+1] and omega[l+1] such
+            # that (1 + s)*sigma[l] == omega[l] in mod z^(l+1)
 
-            # For this particular loop iteration, we have sigma[l] and omega[l],
-            # and are computing sigma[l+1] and omega[l+1]
-            
             # First find Delta, the non-zero coefficient of z^(l+1) in
-            # (1 + s) * sigma[l]
-            # This delta is valid for l (this iteration) only
-            Delta = ( (ONE + s) * sigma[l] ).get_coefficient(l+1)
-            # Make it a polynomial of degree 0
-            Delta = Polynomial(x0=Delta)
+            # (1 + s) * sigma[l]. That one coefficient is just a dot product,
+            # sigma[l] has degree at most l+1
+            Delta = 0
+            for i in xrange(l+2):
+                if sigma[i]:
+                    Delta ^= multable[sigma[i]][S[l+1-i]]
 
             # Can now compute sigma[l+1] and omega[l+1] from
             # sigma[l], omega[l], tao[l], gamma[l], and Delta
-            sigma.append( sigma[l] - Delta * Z * tao[l] )
-            omega.append( omega[l] - Delta * Z * gamma[l] )
+            # (Subtraction is xor)
+            mulrow = multable[Delta]
+            sigma_next[0] = sigma[0]
+            omega_next[0] = omega[0]
+            for i in terms:
+                sigma_next[i] = sigma[i] ^ mulrow[tao[i-1]]
+                omega_next[i] = omega[i] ^ mulrow[gamma[i-1]]
 
             # Now compute the next tao and gamma
             # There are two ways to do this
-            if Delta == ZERO or 2*D[l] > (l+1):
-                # Rule A
-                D.append( D[l] )
-                B.append( B[l] )
-                tao.append( Z * tao[l] )
-                gamma.append( Z * gamma[l] )
-
-            elif Delta != ZERO and 2*D[l] < (l+1):
+            if Delta and (2*D < l+1 or (2*D == l+1 and B == 1)):
                 # Rule B
-                D.append( l + 1 - D[l] )
-                B.append( 1 - B[l] )
-                tao.append( sigma[l] // Delta )
-                gamma.append( omega[l] // Delta )
-            elif 2*D[l] == (l+1):
-                if B[l] == 0:
-                    # Rule A (same as above)
-                    D.append( D[l] )
-                    B.append( B[l] )
-                    tao.append( Z * tao[l] )
-                    gamma.append( Z * gamma[l] )
-
-                else:
-                    # Rule B (same as above)
-                    D.append( l + 1 - D[l] )
-                    B.append( 1 - B[l] )
-                    tao.append( sigma[l] // Delta )
-                    gamma.append( omega[l] // Delta )
+                D = l + 1 - D
+                B = 1 - B
+                mulrow = multable[invtable[Delta]]
+                for i in xrange(size):
+                    tao[i] = mulrow[sigma[i]]
+                    gamma[i] = mulrow[omega[i]]
             else:
-                raise Exception("Code shouldn't have gotten here")
+                # Rule A
+                # Multiply tao and gamma by z. The top coefficients are always
+                # 0 at this point.
+                tao.pop()
+                tao.insert(0, 0)
+                gamma.pop()
+                gamma.insert(0, 0)
 
+            sigma, sigma_next = sigma_next, sigma
+            omega, omega_next = omega_next, omega
 
-        return sigma[-1], omega[-1]
+        element = self.field.element
+        return (Polynomial(element(c) for c in reversed(sigma)),
+                Polynomial(element(c) for c in reversed(omega)))
 
     def _chien_search(self, sigma):
         """Recall the definition of sigma, it has s roots. To find them, this
-        function evaluates sigma at all 255 non-zero points to find the roots
-        The inverse of the roots are X_i, the error locations
+        function evaluates sigma at α^(-j) for each of the n positions j in
+        the codeword. The inverse of the roots are X_i, the error locations
 
         Returns a list X of error locations, and a corresponding list j of
         error positions (the discrete log of the corresponding X value) The
         lists are up to s elements large.
 
-        Important technical math note: This implementation is not actually
-        Chien's search. Chien's search is a way to evaluate the polynomial
-        such that each evaluation only takes constant time. This here simply
-        does 255 evaluations straight up, which is much less efficient.
+        This is Chien's search: one register is kept per coefficient of
+        sigma, holding sigma_i * α^(-i*j) for the current position j. Moving
+        to the next position multiplies each register by the constant
+        α^(-i), so each evaluation is just deg(sigma) table lookups and an xor
+        of the registers. The search stops as soon as deg(sigma) roots have
+        been found.
         """
         X = []
         j = []
-        p = GF256int(3)
-        for l in xrange(1,256):
-            # These evaluations could be more efficient, but oh well
-            if sigma.evaluate( p**l ) == 0:
-                X.append( p**(-l) )
-                # This is different than the notes, I think the notes were in error
-                # Notes said j values were just l, when it's actually 255-l
-                j.append(255 - l)
+        field = self.field
+        alpha = field.generator
+
+        # registers[i] starts out as the coefficient of z^i, which is sigma
+        # evaluated term by term at α^0
+        registers = [int(c) for c in reversed(sigma.coefficients)]
+        degree = len(registers) - 1
+        terms = range(1, degree+1)
+        # Multiplying by α^(-i) is a row of the product table. The constant
+        # term of sigma never changes, so it has no step.
+        steps = [None] + [self._multable[field.pow(alpha, -i)] for i in terms]
+
+        for position in xrange(self.n):
+            value = registers[0]
+            for i in terms:
+                value ^= registers[i]
+            if value == 0:
+                X.append(field.element(field.pow(alpha, position)))
+                j.append(position)
+                if len(j) == degree:
+                    break
+            for i in terms:
+                registers[i] = steps[i][registers[i]]
 
         return X, j
 
-    def _forney(self, omega, X):
-        """Computes the error magnitudes"""
-        # XXX Is floor division okay here? Should this be ceiling?
-        s = (self.n - self.k) // 2
+    def _forney(self, omega, X, sigma):
+        """Computes the error magnitudes with Forney's formula:
+        Y_l = X_l * omega(X_l^-1) / sigma'(X_l^-1)
+        where sigma' is the formal derivative of sigma. X is the list of
+        error locations as returned by _chien_search.
 
-        Y = []
+        In GF(2^m) the formal derivative just keeps the odd power terms of
+        sigma, each moved down one power, since 2 = 0 and 3 = 1.
 
-        for l, Xl in enumerate(X):
-            # Compute the first part of Yl
-            Yl = Xl**s
-            Yl *= omega.evaluate( Xl.inverse() )
-            Yl *= Xl.inverse()
-
-            # Compute the sequence product and multiply its inverse in
-            prod = GF256int(1)
-            for ji in xrange(s):
-                if ji == l:
-                    continue
-                if ji < len(X):
-                    Xj = X[ji]
-                else:
-                    Xj = GF256int(0)
-                prod = prod * (Xl - Xj)
-            Yl = Yl * prod.inverse()
+        Returns None if sigma' is 0 at any X_l^-1. That means X_l is a
+        repeated root of sigma, so the errors can't be corrected.
+        """
+        field = self.field
+        # Plain int coefficients, in order of decreasing power
+        omega = omega.coefficients
+        sigma = list(reversed(sigma.coefficients))
+        sigma_prime = [sigma[i] if i % 2 else 0 for i in xrange(1, len(sigma))]
+        sigma_prime.reverse()
 
-            Y.append(Yl)
+        Y = []
+        for Xl in X:
+            Xl_inv = self._invtable[Xl]
+            derivative = field.poly_eval(sigma_prime, Xl_inv)
+            if derivative == 0:
+                return None
+            Yl = field.div(field.poly_eval(omega, Xl_inv), derivative)
+            Y.append(field.element(field.mul(Xl, Yl)))
         return Y
 
+# Coder registry
+#
+# Creating a coder works out its generator and lookup tables, and the first
+# batch call builds bigger tables on top of that. Code that makes a coder for
+# every request should use get_coder() instead, which hands out one shared
+# coder per set of parameters. At most coder_cache_size of them are kept, the
+# least recently used is dropped first.
+
+coder_cache_size = 32
+_coders = OrderedDict()
+_coders_lock = threading.Lock()
+
+def get_coder(n, k, field=None):
+    """Returns a shared RSCoder(n, k, field), creating it if there isn't one
+    yet. The coder may be in use elsewhere in the process, so it must not be
+    modified. Every RSCoder method is safe to call from several threads."""
+    if field is None:
+        field = ff.GF256
+    key = (n, k, field.m, field.poly, field.generator)
+    with _coders_lock:
+        try:
+            coder = _coders.pop(key)
+        except KeyError:
+            coder = RSCoder(n, k, field)
+            while _coders and len(_coders) >= coder_cache_size:
+                _coders.popitem(last=False)
+        _coders[key] = coder
+    return coder
+
+def _store(dst, start, data):
+    """Copies data (a bytearray or memoryview) into the writable buffer dst
+    starting at start"""
+    if isinstance(dst, mmap.mmap):
+        # mmap objects on python 2 only take strings
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        data = str(data)
+    dst[start:start+len(data)] = data
+
+def read_chunks(fileobj, size):
+    """Yields strings of exactly size bytes read from the file-like object
+    fileobj, except for the last one which may be short. Short reads (from
+    pipes, for example) are put back together, so every chunk but the last
+    holds a whole number of blocks if size is a multiple of the block size."""
+    buf = ""
+    while True:
+        piece = fileobj.read(size - len(buf))
+        if not piece:
+            break
+        buf += piece
+        if len(buf) == size:
+            yield buf
+            buf = ""
+    if buf:
+        yield buf
+
+def _split_rows(data, width):
+    """Splits data into rows of width bytes. data is a buffer whose length is
+    a multiple of width, or already a sequence of rows."""
+    if isinstance(data, (str, bytearray, buffer, memoryview)):
+        if len(data) % width:
+            raise ValueError("Buffer length must be a multiple of %d" % width)
+        data = [data[i:i+width] for i in xrange(0, len(data), width)]
+    for row in data:
+        if len(row) != width:
+            raise ValueError("Every row must be %d bytes" % width)
+    return data
+
+def _as_array(data, width):
+    """Turns data into a 2-D uint8 NumPy array with width columns. data is an
+    array, a buffer whose length is a multiple of width, or a sequence of
+    rows."""
+    if isinstance(data, (str, bytearray, buffer, memoryview)):
+        if len(data) % width:
+            raise ValueError("Buffer length must be a multiple of %d" % width)
+        if isinstance(data, memoryview):
+            # numpy.frombuffer doesn't take memoryviews on python 2
+            data = numpy.asarray(data, dtype=numpy.uint8)
+        else:
+            data = numpy.frombuffer(data, dtype=numpy.uint8)
+        data = data.reshape(-1, width)
+    elif isinstance(data, numpy.ndarray):
+        data = data.astype(numpy.uint8, copy=False)
+    else:
+        data = numpy.array([numpy.frombuffer(bytes(row), dtype=numpy.uint8)
+            for row in data], dtype=numpy.uint8)
+    if data.ndim != 2 or data.shape[1] != width:
+        raise ValueError("Every row must be %d bytes" % width)
+    return data
+
 if __name__ == "__main__":
     import sys
     coder = RSCoder(255,223)
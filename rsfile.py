@@ -0,0 +1,144 @@
+# Copyright (c) 2010 Andrew Brown <brownan@cs.duke.edu, brownan@gmail.com>
+# See LICENSE.txt for license terms
+
+"""This module gives random access to a file encoded with
+RSCoder.encode_stream(), without decoding it from the start.
+
+The encoded file is memory mapped. A read only looks at the codewords that
+hold the requested bytes. Each of those codewords has its syndromes checked;
+valid ones are read straight out of the map, and only the ones with errors
+are actually corrected. Recently checked or corrected blocks are kept in an
+LRU cache, so reading the same area again costs nothing.
+"""
+
+import os
+import mmap
+from collections import OrderedDict
+
+import rs
+
+class RSFile(object):
+    def __init__(self, f, n=255, k=223, cache_blocks=64):
+        """Opens the encoded file f, either a filename or a file object with a
+        fileno(), for reading. n and k must be the ones it was encoded with.
+        At most cache_blocks blocks are kept in the cache.
+        """
+        if cache_blocks < 1:
+            raise ValueError("cache_blocks must be at least 1")
+        self.coder = rs.get_coder(n, k)
+        self.n = n
+        self.k = k
+        self.cache_blocks = cache_blocks
+        # Maps block number to None for a valid block, or the corrected
+        # message for a block that had errors
+        self._cache = OrderedDict()
+
+        if isinstance(f, basestring):
+            self._file = open(f, "rb")
+        else:
+            self._file = f
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0 or size % n:
+            raise ValueError("Encoded file length must be a non-zero multiple"
+                    " of %d" % n)
+        self._map = mmap.mmap(self._file.fileno(), size,
+                access=mmap.ACCESS_READ)
+        self.closed = False
+
+        # The trailer is the last codeword. Its message is the number of data
+        # bytes in the block before it.
+        self.blocks = size // n - 1
+        last = ord(self._block(self.blocks)[k-1])
+        if self.blocks == 0:
+            valid = last == 0
+        else:
+            valid = 0 < last <= k
+        if not valid:
+            raise ValueError("Encoded file has an invalid trailer")
+        self.length = max(self.blocks - 1, 0) * k + last
+        self._pos = 0
+
+    def _block(self, index):
+        """Returns the k message bytes of block index, as a buffer into the
+        map if the block is valid or as a string of the corrected message if
+        it isn't. Raises IOError if the block can't be corrected."""
+        n = self.n
+        k = self.k
+        try:
+            message = self._cache.pop(index)
+        except KeyError:
+            message = bytearray(k)
+            status = self.coder.decode_into(buffer(self._map, index * n, n),
+                    message)
+            if status < 0:
+                raise IOError("Block %d at offset %d could not be"
+                        " corrected" % (index, index * n))
+            message = str(message) if status else None
+            while len(self._cache) >= self.cache_blocks:
+                self._cache.popitem(last=False)
+        self._cache[index] = message
+
+        if message is None:
+            return buffer(self._map, index * n, k)
+        return message
+
+    def _pieces(self, size):
+        """Yields strings covering the next size bytes from the current
+        position, moving the position past them"""
+        k = self.k
+        end = self.length if size is None or size < 0 else min(
+                self.length, self._pos + size)
+        while self._pos < end:
+            index, start = divmod(self._pos, k)
+            take = min(k - start, end - self._pos)
+            yield self._block(index)[start:start+take]
+            self._pos += take
+
+    def read(self, size=-1):
+        """Reads up to size bytes, or to the end of the data if size is
+        negative"""
+        self._check_closed()
+        return "".join(self._pieces(size))
+
+    def readinto(self, b):
+        """Reads up to len(b) bytes into the writable buffer b, returning the
+        number of bytes read"""
+        self._check_closed()
+        offset = 0
+        for piece in self._pieces(len(b)):
+            b[offset:offset+len(piece)] = piece
+            offset += len(piece)
+        return offset
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._check_closed()
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.length
+        elif whence != os.SEEK_SET:
+            raise ValueError("Invalid whence %r" % whence)
+        if offset < 0:
+            raise IOError("Negative seek position %d" % offset)
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        self._check_closed()
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._map.close()
+            self._file.close()
+            self._cache.clear()
+            self.closed = True
+
+    def _check_closed(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
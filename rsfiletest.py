@@ -0,0 +1,67 @@
+import unittest
+import tempfile
+from StringIO import StringIO
+
+import rs
+import rsfile
+
+class TestRSFile(unittest.TestCase):
+    def setUp(self):
+        self.coder = rs.RSCoder(30,10)
+        self.data = "".join(chr((i*11) % 256) for i in xrange(97))
+        encoded = "".join(self.coder.encode_stream(StringIO(self.data)))
+
+        # Damage one byte in block 2 and too many bytes in block 5
+        encoded = list(encoded)
+        encoded[2*30 + 4] = chr(ord(encoded[2*30 + 4]) ^ 1)
+        for i in xrange(11):
+            encoded[5*30 + i] = chr(ord(encoded[5*30 + i]) ^ 1)
+
+        self.file = tempfile.TemporaryFile()
+        self.file.write("".join(encoded))
+        self.file.flush()
+        self.f = rsfile.RSFile(self.file, 30, 10, cache_blocks=3)
+
+    def tearDown(self):
+        self.f.close()
+
+    def test_read(self):
+        self.assertEqual(97, self.f.length)
+        self.assertEqual(self.data[:15], self.f.read(15))
+        self.assertEqual(15, self.f.tell())
+        # Block 2 gets corrected
+        self.assertEqual(self.data[15:35], self.f.read(20))
+
+        self.f.seek(90)
+        self.assertEqual(self.data[90:], self.f.read())
+        self.assertEqual("", self.f.read())
+
+    def test_seek(self):
+        self.f.seek(-7, 2)
+        self.assertEqual(self.data[-7:-2], self.f.read(5))
+        self.f.seek(-20, 1)
+        self.assertEqual(self.data[75:85], self.f.read(10))
+
+    def test_readinto(self):
+        buf = bytearray(12)
+        self.f.seek(18)
+        self.assertEqual(12, self.f.readinto(buf))
+        self.assertEqual(self.data[18:30], str(buf))
+
+    def test_uncorrectable(self):
+        self.f.seek(50)
+        self.assertRaises(IOError, self.f.read, 10)
+        # Other blocks still read fine
+        self.f.seek(60)
+        self.assertEqual(self.data[60:70], self.f.read(10))
+
+    def test_cache(self):
+        for pos in xrange(0, 97, 10):
+            if pos != 50:
+                self.f.seek(pos)
+                self.f.read(10)
+        self.assertEqual(3, len(self.f._cache))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,13 @@
 import unittest
 import itertools
+from StringIO import StringIO
+import mmap
+import tempfile
 
 import rs
+import ff
+from ff import GF256int
+from polynomial import Polynomial
 
 class TestRSverify(unittest.TestCase):
     def setUp(self):
@@ -31,6 +37,284 @@ class TestRSverify(unittest.TestCase):
 
             self.assertFalse(self.coder.verify(bad_code))
 
+class TestRSencoding(unittest.TestCase):
+    def test_parity_matches_poly(self):
+        """The shift register encoder must give the same codeword as the
+        polynomial division encoder"""
+        for n, k in ((255,223), (255,13), (30,10), (20,13)):
+            coder = rs.RSCoder(n, k)
+            for m in ("Hello, world!"[:k], "\0\0\x01abc", "\xff"*k, ""):
+                code = coder.encode(m)
+                c = coder.encode(m, poly=True)
+                self.assertEqual(n, len(code))
+                self.assertEqual(code,
+                        "".join(chr(x) for x in c.coefficients).rjust(n, "\0"))
+
+    def test_bytearray(self):
+        coder = rs.RSCoder(255,223)
+        self.assertEqual(coder.encode("Hello, world!"),
+                coder.encode(bytearray("Hello, world!")))
+
+    def test_too_long(self):
+        coder = rs.RSCoder(20,13)
+        self.assertRaises(ValueError, coder.encode, "x"*14)
+
+class TestRSbatch(unittest.TestCase):
+    def setUp(self):
+        self.coder = rs.RSCoder(30,10)
+        self.data = "".join(chr((i*7) % 256) for i in xrange(10*20))
+        self.expected = [self.coder.encode(self.data[i:i+10])
+                for i in xrange(0, len(self.data), 10)]
+
+    @unittest.skipIf(rs.numpy is None, "NumPy is not installed")
+    def test_encode_many(self):
+        out = self.coder.encode_many(self.data)
+        self.assertEqual(out.shape, (20, 30))
+        self.assertEqual([row.tobytes() for row in out], self.expected)
+
+        rows = [self.data[i:i+10] for i in xrange(0, len(self.data), 10)]
+        out = self.coder.encode_many(rows)
+        self.assertEqual([row.tobytes() for row in out], self.expected)
+
+        self.assertRaises(ValueError, self.coder.encode_many, "x"*15)
+
+    def test_encode_many_fallback(self):
+        saved = rs.numpy
+        rs.numpy = None
+        try:
+            out = self.coder.encode_many(self.data)
+        finally:
+            rs.numpy = saved
+        self.assertEqual(out, self.expected)
+
+    def _damaged(self):
+        codes = [bytearray(c) for c in self.expected]
+        codes[3][0] ^= 1
+        codes[3][29] ^= 0x55
+        codes[7][12] ^= 0xff
+        for i in xrange(11):
+            codes[11][i] ^= 0x40
+        return "".join(str(c) for c in codes)
+
+    def _check_decoded(self, messages, status):
+        self.assertEqual(list(status), [0]*3 + [2] + [0]*3 + [1] + [0]*3 +
+                [-1] + [0]*8)
+        for i, m in enumerate(messages):
+            if i != 11:
+                self.assertEqual(m, self.data[i*10:(i+1)*10])
+
+    @unittest.skipIf(rs.numpy is None, "NumPy is not installed")
+    def test_decode_many(self):
+        messages, status = self.coder.decode_many(self._damaged())
+        self.assertEqual(messages.shape, (20, 10))
+        self._check_decoded([m.tobytes() for m in messages], status)
+
+    @unittest.skipIf(rs.numpy is None, "NumPy is not installed")
+    def test_decode_many_inplace(self):
+        codes = self.coder.encode_many(self.data)
+        messages, status = self.coder.decode_many(codes)
+        self.assertFalse(status.any())
+        # Valid codewords are passed straight through without copying
+        self.assertTrue(rs.numpy.shares_memory(messages, codes))
+
+        codes[4][20] ^= 3
+        messages, status = self.coder.decode_many(codes, inplace=True)
+        self.assertEqual(status[4], 1)
+        self.assertEqual(codes[4].tobytes(), self.expected[4])
+
+        # Read-only input is copied instead
+        codes[4][20] ^= 3
+        damaged = codes.tobytes()
+        messages, status = self.coder.decode_many(damaged, inplace=True)
+        self.assertEqual(status[4], 1)
+        self.assertEqual(messages[4].tobytes(), self.expected[4][:10])
+
+    def test_decode_many_fallback(self):
+        saved = rs.numpy
+        rs.numpy = None
+        try:
+            messages, status = self.coder.decode_many(self._damaged())
+        finally:
+            rs.numpy = saved
+        self._check_decoded(messages, status)
+
+    def test_parity_matrix(self):
+        pm = self.coder.parity_matrix()
+        self.assertEqual(len(pm), 10)
+        # Encoding is linear: the parity of a message is the xor of its
+        # bytes times the rows of the parity matrix
+        m = bytearray(self.data[:10])
+        parity = bytearray(20)
+        for i, b in enumerate(m):
+            for j in xrange(20):
+                parity[j] ^= ff.multable[b][pm[i][j]]
+        self.assertEqual(str(parity), self.expected[0][10:])
+
+class TestRSstream(unittest.TestCase):
+    def setUp(self):
+        self.coder = rs.RSCoder(30,10)
+
+    def _roundtrip(self):
+        for length in (0, 1, 10, 11, 95):
+            data = "".join(chr((i*7 + length) % 256) for i in xrange(length))
+            encoded = "".join(self.coder.encode_stream(StringIO(data),
+                chunk_blocks=3))
+            self.assertEqual(0, len(encoded) % 30)
+
+            # Damage one byte in every codeword
+            damaged = list(encoded)
+            for i in xrange(0, len(damaged), 30):
+                damaged[i+5] = chr(ord(damaged[i+5]) ^ 0x11)
+            damaged = "".join(damaged)
+
+            decoded = "".join(self.coder.decode_stream(StringIO(damaged),
+                chunk_blocks=2))
+            self.assertEqual(data, decoded)
+
+    def test_stream(self):
+        self._roundtrip()
+
+    def test_stream_fallback(self):
+        saved = rs.numpy
+        rs.numpy = None
+        try:
+            self._roundtrip()
+        finally:
+            rs.numpy = saved
+
+    def test_bad_stream(self):
+        decode = lambda data: "".join(self.coder.decode_stream(StringIO(data)))
+        self.assertRaises(ValueError, decode, "")
+        self.assertRaises(ValueError, decode, "x"*31)
+        # A trailer claiming more than k bytes in the last block
+        self.assertRaises(ValueError, decode, self.coder.encode("x"*10) +
+                self.coder.encode(chr(11)))
+
+    def _uncorrectable(self):
+        data = "".join(chr(i % 256) for i in xrange(60))
+        encoded = list("".join(self.coder.encode_stream(StringIO(data))))
+        # Too many errors in the middle codeword of 7
+        for i in xrange(90, 101):
+            encoded[i] = chr(ord(encoded[i]) ^ 0xff)
+        decode = lambda: "".join(self.coder.decode_stream(
+            StringIO("".join(encoded)), chunk_blocks=2))
+        self.assertRaises(IOError, decode)
+
+    def test_uncorrectable(self):
+        self._uncorrectable()
+
+    def test_uncorrectable_fallback(self):
+        saved = rs.numpy
+        rs.numpy = None
+        try:
+            self._uncorrectable()
+        finally:
+            rs.numpy = saved
+
+class TestRSbuffers(unittest.TestCase):
+    def setUp(self):
+        self.coder = rs.RSCoder(30,10)
+        self.message = "Hello, wor"
+        self.code = self.coder.encode(self.message)
+
+    def test_encode_into(self):
+        dst = bytearray(30)
+        self.coder.encode_into(self.message, dst)
+        self.assertEqual(self.code, str(dst))
+
+        # Parity only, into a memoryview
+        buf = bytearray(self.message + "\0"*20)
+        view = memoryview(buf)
+        self.coder.encode_into(view[:10], view[10:])
+        self.assertEqual(self.code, str(buf))
+
+        self.assertRaises(ValueError, self.coder.encode_into, "x"*9, dst)
+        self.assertRaises(ValueError, self.coder.encode_into, "x"*10,
+                bytearray(29))
+
+    def test_decode_into(self):
+        buf = bytearray(self.code)
+        self.assertEqual(0, self.coder.decode_into(buf))
+
+        buf[3] ^= 0xff
+        buf[25] ^= 0x01
+        message = bytearray(10)
+        self.assertEqual(2, self.coder.decode_into(buf, message))
+        self.assertEqual(self.message, str(message))
+        # The source is left alone when there's a destination
+        self.assertNotEqual(self.code, str(buf))
+
+        self.assertEqual(2, self.coder.decode_into(memoryview(buf)))
+        self.assertEqual(self.code, str(buf))
+
+    def test_mmap(self):
+        f = tempfile.TemporaryFile()
+        f.write("\0"*30)
+        f.flush()
+        m = mmap.mmap(f.fileno(), 30)
+        try:
+            self.coder.encode_into(self.message, m)
+            self.assertEqual(self.code, m[:])
+
+            m[7] = "\x00"
+            self.assertEqual(1, self.coder.decode_into(m))
+            self.assertEqual(self.code, m[:])
+        finally:
+            m.close()
+            f.close()
+
+class TestRSsyndromes(unittest.TestCase):
+    def test_syndromes(self):
+        coder = rs.RSCoder(255,223)
+        code = coder.encode("Hello, world!")
+        self.assertEqual(coder.syndromes(code), [0]*32)
+
+        bad = code[:100] + "\x01" + code[101:]
+        r = Polynomial(GF256int(ord(x)) for x in bad)
+        s = coder.syndromes(bad)
+        self.assertEqual(len(s), 32)
+        for l in xrange(1, 33):
+            self.assertEqual(s[l-1], r.evaluate(GF256int(3)**l))
+
+class TestRSupdate(unittest.TestCase):
+    def setUp(self):
+        self.coder = rs.RSCoder(30,10)
+        self.code = self.coder.encode("Hello, wor")
+
+    def test_update_parity(self):
+        new = self.coder.update_parity(self.code, 3, "lo,", "LO!")
+        self.assertEqual(self.coder.encode("HelLO! wor"), new)
+
+        buf = bytearray(self.code)
+        self.assertTrue(buf is self.coder.update_parity(buf, 9, "r", "m"))
+        self.assertEqual(self.coder.encode("Hello, wom"), str(buf))
+
+        self.assertRaises(ValueError, self.coder.update_parity, self.code, 9,
+                "rx", "my")
+
+    def _check_many(self, codes, aslist):
+        messages = [bytearray("Hello, wor") for i in xrange(4)]
+        changes = [(0, 0, 1), (0, 9, 2), (2, 5, 3), (3, 5, 4), (3, 6, 0)]
+        for row, position, value in changes:
+            messages[row][position] = value
+        rows, positions, values = zip(*changes)
+        self.coder.update_parity_many(codes, rows, positions, values)
+        for message, code in zip(messages, codes):
+            code = str(code) if aslist else code.tobytes()
+            self.assertEqual(self.coder.encode(message), code)
+
+    @unittest.skipIf(rs.numpy is None, "NumPy is not installed")
+    def test_update_parity_many(self):
+        self._check_many(self.coder.encode_many(self.code[:10]*4), False)
+
+    def test_update_parity_many_fallback(self):
+        saved = rs.numpy
+        rs.numpy = None
+        try:
+            self._check_many([bytearray(self.code) for i in xrange(4)], True)
+        finally:
+            rs.numpy = saved
+
 class TestRSdecoding(unittest.TestCase):
     def setUp(self):
         self.coder = rs.RSCoder(255,223)
@@ -118,6 +402,108 @@ class TestRSdecoding(unittest.TestCase):
         decode = self.coder.decode(r)
         self.assertNotEqual(self.string, decode)
 
+class TestBerlekampMassey(unittest.TestCase):
+    def test_locator(self):
+        """sigma has one root per error, at the inverse error locations"""
+        coder = rs.RSCoder(255,223)
+        code = bytearray(coder.encode("Hello, world!"))
+        positions = [3, 77, 200, 254]
+        for p in positions:
+            code[p] ^= 0x21
+        sz = coder._syndrome_polynomial(coder.syndromes(code))
+        sigma, omega = coder._berlekamp_massey(sz)
+        self.assertEqual(sigma.degree(), len(positions))
+        for p in positions:
+            X = GF256int(3)**(254 - p)
+            self.assertEqual(sigma.evaluate(X.inverse()), 0)
+
+class TestChienSearch(unittest.TestCase):
+    def _sigma(self, positions):
+        """Builds sigma(z) = Product( 1 - X_i * z ) for the given positions"""
+        sigma = Polynomial((GF256int(1),))
+        for j in positions:
+            sigma = sigma * Polynomial((GF256int(3)**j, GF256int(1)))
+        return sigma
+
+    def test_roots(self):
+        coder = rs.RSCoder(255,223)
+        X, j = coder._chien_search(self._sigma([0, 17, 254]))
+        self.assertEqual(sorted(j), [0, 17, 254])
+        for Xi, ji in zip(X, j):
+            self.assertEqual(Xi, GF256int(3)**ji)
+
+    def test_shortened(self):
+        """Roots outside of a shortened codeword are not reported"""
+        coder = rs.RSCoder(30,10)
+        X, j = coder._chien_search(self._sigma([3, 29, 100]))
+        self.assertEqual(sorted(j), [3, 29])
+
+class TestErasures(unittest.TestCase):
+    def setUp(self):
+        self.coder = rs.RSCoder(255,223)
+        self.string = "Hello, world! This is a long string"
+        self.code = self.coder.encode(self.string)
+
+    def _damage(self, positions):
+        r = bytearray(self.code)
+        for p in positions:
+            r[p] ^= 0x5a
+        return r
+
+    def test_32_erasures(self):
+        """Twice as many erasures as errors can be corrected"""
+        erasures = range(3, 255, 8)
+        self.assertEqual(32, len(erasures))
+        r = self._damage(erasures)
+        self.assertEqual(self.string, self.coder.decode(r, erasures=erasures))
+
+    def test_mixed(self):
+        """10 erasures and 11 errors: 2*11 + 10 <= 32"""
+        erasures = range(0, 100, 10)
+        errors = range(101, 255, 14)
+        self.assertEqual(11, len(errors))
+        r = self._damage(erasures + errors)
+        self.assertEqual(self.string, self.coder.decode(r, erasures=erasures))
+
+    def test_good_erasures(self):
+        """Erasures that turn out to be fine are left alone"""
+        r = self._damage([7])
+        buf = bytearray(r)
+        self.assertEqual(1, self.coder.decode_into(buf, erasures=[7, 8, 9]))
+        self.assertEqual(self.code, str(buf))
+
+    def test_too_many(self):
+        """28 erasures and 4 errors, 2*4 + 28 > 32. A root of the error
+        locator lands on an erasure here, which used to divide by zero."""
+        erasures = [8, 19, 35, 51, 52, 55, 67, 68, 69, 78, 94, 116, 122, 124,
+                133, 143, 166, 167, 170, 171, 172, 177, 196, 203, 209, 230,
+                240, 244]
+        r = self._damage(erasures + [12, 14, 47, 243])
+        buf = bytearray(r)
+        self.assertEqual(-1, self.coder.decode_into(buf, erasures=erasures))
+        self.assertEqual(r, buf)
+        # decode() hands back the message uncorrected
+        self.assertEqual(str(r[:223]), self.coder.decode(r, nostrip=True,
+            erasures=erasures))
+
+    def test_wrong_correction(self):
+        """30 erasures and 10 errors. The error locator comes out constant
+        here, which used to be taken to mean there were only erasures."""
+        erasures = [3, 5, 6, 17, 26, 29, 36, 79, 85, 87, 91, 99, 120, 124,
+                134, 151, 160, 174, 177, 181, 192, 200, 209, 218, 219, 227,
+                228, 230, 234, 239]
+        r = self._damage(erasures + [38, 89, 90, 110, 112, 132, 140, 149,
+            185, 215])
+        buf = bytearray(r)
+        self.assertEqual(-1, self.coder.decode_into(buf, erasures=erasures))
+        self.assertEqual(r, buf)
+
+    def test_bad_erasures(self):
+        self.assertRaises(ValueError, self.coder.decode, self.code,
+                erasures=[255])
+        self.assertRaises(ValueError, self.coder.decode, self.code,
+                erasures=range(33))
+
 class TestOtherConfig(unittest.TestCase):
     """Tests a configuration of the coder other than RS(255,223)"""
 
@@ -171,6 +557,92 @@ class TestOtherConfig(unittest.TestCase):
         decode = coder.decode(c)
         self.assertEqual(m, decode)
 
+    def test37_20(self):
+        """Tests a shortened code with an odd number of parity bytes"""
+        coder = rs.RSCoder(37,20)
+        m = "Hello, world! Hello"
+        code = coder.encode(m)
+
+        # Change 8 bytes, the most this code can tolerate
+        c = list(ord(x) for x in code)
+        for pos in [0, 3, 9, 15, 20, 28, 35, 36]:
+            c[pos] = (c[pos] + 50) % 255
+
+        c = "".join(chr(x) for x in c)
+        self.assertEqual(m, coder.decode(c))
+
+class TestRegistry(unittest.TestCase):
+    def test_shared(self):
+        coder = rs.get_coder(30, 10)
+        self.assertTrue(rs.get_coder(30, 10) is coder)
+        self.assertTrue(rs.get_coder(30, 10, ff.GF256) is coder)
+        self.assertFalse(rs.get_coder(30, 12) is coder)
+        self.assertFalse(rs.get_coder(30, 10, ff.field(5)) is coder)
+        self.assertEqual((30, 10), (coder.n, coder.k))
+
+    def test_eviction(self):
+        saved = rs.coder_cache_size
+        rs.coder_cache_size = 3
+        try:
+            first = rs.get_coder(20, 1)
+            for k in xrange(2, 10):
+                rs.get_coder(20, k)
+            self.assertTrue(len(rs._coders) <= 3)
+            self.assertFalse(rs.get_coder(20, 1) is first)
+        finally:
+            rs.coder_cache_size = saved
+
+    def test_lazy_polynomials(self):
+        coder = rs.RSCoder(30, 10)
+        self.assertFalse(hasattr(coder, "_g") or hasattr(coder, "_h"))
+        self.assertEqual(coder.g.coefficients, coder.gen)
+        self.assertTrue(coder.g is coder.g)
+
+class TestOtherFields(unittest.TestCase):
+    def _damage(self, code, positions, top):
+        r = list(code)
+        for pos in positions:
+            r[pos] = (r[pos] + 50) % top
+        return r
+
+    def test_gf65536(self):
+        coder = rs.RSCoder(1000, 960, field=ff.field(16))
+        m = [(i * 2029) % 65536 for i in xrange(1, 961)]
+        code = coder.encode(m)
+        self.assertEqual(1000, len(code))
+        self.assertEqual(m, list(code[:960]))
+        self.assertTrue(coder.verify(code))
+
+        r = self._damage(code, xrange(3, 1000, 50), 65536)
+        self.assertEqual(m, list(coder.decode(r)))
+        r = list(code[:500]) + [0]*40 + list(code[540:])
+        self.assertEqual(m, list(coder.decode(r, erasures=range(500, 540))))
+        self.assertEqual(coder.encode(m, poly=True).coefficients,
+                tuple(code))
+
+    def test_gf16(self):
+        """Symbols of small fields are still given as bytes"""
+        coder = rs.RSCoder(15, 9, field=ff.field(4))
+        m = "\x01\x02\x0f\x00\x09\x03\x04\x05\x06"
+        code = coder.encode(m)
+        self.assertTrue(coder.verify(code))
+        # A damaged symbol may not even be in the field any more
+        r = "\xf1" + code[1:7] + "\x00" + code[8:14] + "\x03"
+        self.assertEqual(m, coder.decode(r, nostrip=True))
+        self.assertRaises(ValueError, coder.encode, "\x10")
+
+    def test_gtimesh(self):
+        coder = rs.RSCoder(15, 9, field=ff.field(4))
+        self.assertEqual(coder.gtimesh, coder.g * coder.h)
+
+    def test_limits(self):
+        self.assertRaises(ValueError, rs.RSCoder, 16, 10, field=ff.field(4))
+        coder = rs.RSCoder(20, 10, field=ff.field(16))
+        self.assertRaises(TypeError, coder.encode, "hello")
+        self.assertRaises(TypeError, coder.encode_many, [[0] * 10])
+        self.assertRaises(TypeError, coder.decode_into, [0] * 20)
+
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,142 @@
+# Copyright (c) 2010 Andrew Brown <brownan@cs.duke.edu, brownan@gmail.com>
+# See LICENSE.txt for license terms
+
+"""This module scrubs files of RS codewords, such as the output of
+RSCoder.encode_stream(), checking every block and repairing damaged ones in
+place.
+
+The file is memory mapped rather than read into strings. Blocks are checked a
+batch at a time: with NumPy the syndromes of a whole batch are computed at
+once by RSCoder.decode_many() working directly on the map, otherwise block
+by block. Only blocks with errors are corrected, and only their bytes are
+written back. The rate blocks are scanned at can be capped, so a scrub can run
+alongside other work on the same disks.
+"""
+
+import os
+import mmap
+import time
+
+import rs
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class ScrubReport(object):
+    """The result of a scrub. corrected maps the byte offset of each repaired
+    block to the number of bytes corrected in it, and uncorrectable lists the
+    offsets of blocks with too many errors to correct."""
+    def __init__(self):
+        self.blocks = 0
+        self.corrected = {}
+        self.uncorrectable = []
+        self.seconds = 0.0
+
+    def __str__(self):
+        lines = ["%d blocks scrubbed in %.1f seconds, %d corrected, %d"
+                " uncorrectable" % (self.blocks, self.seconds,
+                len(self.corrected), len(self.uncorrectable))]
+        for offset in sorted(self.corrected):
+            lines.append("corrected %d bytes at offset %d" %
+                    (self.corrected[offset], offset))
+        for offset in self.uncorrectable:
+            lines.append("uncorrectable block at offset %d" % offset)
+        return "\n".join(lines)
+
+def scrub(f, n=255, k=223, repair=True, batch_blocks=1024, max_rate=None):
+    """Scrubs the encoded file f, either a filename or a file object with a
+    fileno() opened for update (or just reading if repair is False). Its
+    length must be a multiple of n.
+
+    If repair is False blocks are only checked and the file is not modified.
+    batch_blocks blocks are checked at a time. If max_rate is given, the scan
+    sleeps as needed to keep to at most max_rate bytes per second.
+
+    Returns a ScrubReport.
+    """
+    coder = rs.get_coder(n, k)
+    if isinstance(f, basestring):
+        fileobj = open(f, "r+b" if repair else "rb")
+    else:
+        fileobj = f
+    try:
+        size = os.fstat(fileobj.fileno()).st_size
+        if size % n:
+            raise ValueError("Encoded file length must be a multiple of %d"
+                    % n)
+        report = ScrubReport()
+        if size == 0:
+            return report
+        access = mmap.ACCESS_WRITE if repair else mmap.ACCESS_READ
+        mapped = mmap.mmap(fileobj.fileno(), size, access=access)
+        try:
+            _scrub_map(coder, mapped, size, repair, batch_blocks, max_rate,
+                    report)
+            if repair and report.corrected:
+                mapped.flush()
+        finally:
+            mapped.close()
+    finally:
+        if fileobj is not f:
+            fileobj.close()
+    return report
+
+def _scrub_map(coder, mapped, size, repair, batch_blocks, max_rate, report):
+    n = coder.n
+    batch = n * batch_blocks
+    start_time = time.time()
+    for start in xrange(0, size, batch):
+        length = min(batch, size - start)
+        if numpy is not None:
+            codes = numpy.frombuffer(mapped, dtype=numpy.uint8, count=length,
+                    offset=start).reshape(-1, n)
+            # With repair the corrections go straight into the map
+            status = coder.decode_many(codes, inplace=repair)[1]
+            del codes
+            for row in numpy.flatnonzero(status):
+                _record(report, start + row * n, int(status[row]))
+        else:
+            code = bytearray(n)
+            for offset in xrange(start, start + length, n):
+                count = coder.decode_into(buffer(mapped, offset, n), code)
+                if count == 0:
+                    continue
+                if count > 0 and repair:
+                    mapped[offset:offset+n] = str(code)
+                _record(report, offset, count)
+        report.blocks += length // n
+
+        elapsed = time.time() - start_time
+        if max_rate:
+            wait = float(start + length) / max_rate - elapsed
+            if wait > 0:
+                time.sleep(wait)
+                elapsed += wait
+        report.seconds = elapsed
+
+def _record(report, offset, count):
+    if count < 0:
+        report.uncorrectable.append(offset)
+    else:
+        report.corrected[offset] = count
+
+if __name__ == "__main__":
+    import sys
+    import optparse
+    parser = optparse.OptionParser(usage="%prog [options] <encoded file>")
+    parser.add_option("-c", "--check", action="store_true",
+            help="only check, don't repair")
+    parser.add_option("-r", "--rate", type="float",
+            help="maximum scan rate in MB per second")
+    parser.add_option("-n", type="int", default=255)
+    parser.add_option("-k", type="int", default=223)
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("Expected one file")
+    rate = options.rate * 1024 * 1024 if options.rate else None
+    report = scrub(args[0], options.n, options.k, repair=not options.check,
+            max_rate=rate)
+    print report
+    sys.exit(1 if report.uncorrectable else 0)
@@ -0,0 +1,77 @@
+import unittest
+import tempfile
+import time
+
+import rs
+import scrub
+
+class TestScrub(unittest.TestCase):
+    def setUp(self):
+        self.coder = rs.RSCoder(30, 10)
+        data = "".join(chr((i*7) % 256) for i in xrange(10*40))
+        self.clean = "".join(self.coder.encode(data[i:i+10])
+                for i in xrange(0, len(data), 10))
+
+        # A few errors in block 3, too many in block 17
+        damaged = list(self.clean)
+        for i in (3*30, 3*30 + 12, 3*30 + 29):
+            damaged[i] = chr(ord(damaged[i]) ^ 0x55)
+        for i in xrange(11):
+            damaged[17*30 + i] = chr(ord(damaged[17*30 + i]) ^ 0x55)
+        self.damaged = "".join(damaged)
+
+        self.file = tempfile.TemporaryFile()
+        self.file.write(self.damaged)
+        self.file.flush()
+
+    def tearDown(self):
+        self.file.close()
+
+    def _contents(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def _check_report(self, report):
+        self.assertEqual(40, report.blocks)
+        self.assertEqual({3*30: 3}, report.corrected)
+        self.assertEqual([17*30], report.uncorrectable)
+
+    def test_repair(self):
+        self._check_report(scrub.scrub(self.file, 30, 10, batch_blocks=7))
+        contents = self._contents()
+        self.assertEqual(self.clean[:17*30], contents[:17*30])
+        # The uncorrectable block is left alone
+        self.assertEqual(self.damaged[17*30:18*30], contents[17*30:18*30])
+
+        # Nothing left to repair
+        report = scrub.scrub(self.file, 30, 10)
+        self.assertEqual({}, report.corrected)
+
+    def test_check_only(self):
+        self._check_report(scrub.scrub(self.file, 30, 10, repair=False))
+        self.assertEqual(self.damaged, self._contents())
+
+    def test_fallback(self):
+        saved = scrub.numpy
+        scrub.numpy = None
+        try:
+            self._check_report(scrub.scrub(self.file, 30, 10, batch_blocks=7))
+        finally:
+            scrub.numpy = saved
+        self.assertEqual(self.clean[:17*30], self._contents()[:17*30])
+
+    def test_rate(self):
+        start = time.time()
+        scrub.scrub(self.file, 30, 10, repair=False, batch_blocks=10,
+                max_rate=6000)
+        # 1200 bytes at 6000 bytes per second
+        self.assertTrue(time.time() - start >= 0.19)
+
+    def test_bad_length(self):
+        self.file.write("x")
+        self.file.flush()
+        self.assertRaises(ValueError, scrub.scrub, self.file, 30, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# Copyright (c) 2010 Andrew Brown <brownan@cs.duke.edu, brownan@gmail.com>
+# See LICENSE.txt for license terms
+
+"""This module is an optional on-disk cache for the lookup tables the other
+modules generate: the GF(2^8) product table built when ff is imported, the
+log tables of other fields, and the batch tables of each coder.
+
+It's off unless a cache directory is set, either with set_directory() or
+with the RS_TABLE_CACHE environment variable (which has to be set before ff
+is imported to cover the GF(2^8) table). Then every table is looked for in
+that directory first, and generated and saved there if it isn't found.
+
+Each table is a file holding a short header and the raw table bytes. The
+header has a magic number, a format version, the length and a CRC-32 of the
+table. Tables are memory mapped to load them, and a file that doesn't match
+its header (truncated, corrupted, or written by a different version) is
+generated again and replaced. Files are written to a temporary name and
+renamed into place, so several processes can share one directory.
+"""
+
+import os
+import mmap
+import struct
+import tempfile
+import zlib
+
+MAGIC = "RSTB"
+VERSION = 1
+
+_header = struct.Struct(">4sBxxxIQ")
+
+directory = os.environ.get("RS_TABLE_CACHE") or None
+
+def set_directory(path):
+    """Sets the cache directory, or turns the cache off if path is None. The
+    directory is created when the first table is saved."""
+    global directory
+    directory = path
+
+def load(name, build, length=None):
+    """Returns the table called name as a read-only buffer. If the cache is
+    off, this just returns build(). Otherwise the table is loaded from the
+    cache directory if it's there and valid, and if it isn't, build() is
+    called to make it (as a string) and it is saved for next time.
+
+    If length is given, a cached table of any other length is stale and is
+    built again.
+    """
+    if directory is None:
+        return build()
+    path = os.path.join(directory, name + ".tbl")
+    data = _read(path, length)
+    if data is None:
+        data = build()
+        _write(path, data)
+    return data
+
+def _read(path, length):
+    """Maps the table file at path, returning a buffer of the table or None
+    if it's missing or invalid"""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _header.size:
+                return None
+            mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    except (IOError, OSError, mmap.error):
+        return None
+
+    magic, version, crc, stored = _header.unpack(mapped[:_header.size])
+    data = buffer(mapped, _header.size)
+    if (magic != MAGIC or version != VERSION or stored != len(data) or
+            (length is not None and stored != length) or
+            zlib.crc32(data) & 0xffffffff != crc):
+        return None
+    return data
+
+def _write(path, data):
+    """Saves a table. Failing to is not an error, the cache is only an
+    optimization."""
+    header = _header.pack(MAGIC, VERSION, zlib.crc32(data) & 0xffffffff,
+            len(data))
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, temp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(data)
+            os.chmod(temp, 0644)
+            os.rename(temp, path)
+        except:
+            os.unlink(temp)
+            raise
+    except (IOError, OSError):
+        pass
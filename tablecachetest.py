@@ -0,0 +1,88 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import ff
+import rs
+import tablecache
+
+class TestTableCache(unittest.TestCase):
+    def setUp(self):
+        self.saved = tablecache.directory
+        self.dir = tempfile.mkdtemp()
+        tablecache.set_directory(self.dir)
+        self.builds = 0
+
+    def tearDown(self):
+        tablecache.set_directory(self.saved)
+        shutil.rmtree(self.dir)
+
+    def build(self):
+        self.builds += 1
+        return "table data"
+
+    def test_load(self):
+        self.assertEqual("table data", str(tablecache.load("t", self.build)))
+        self.assertEqual("table data", str(tablecache.load("t", self.build)))
+        self.assertEqual(1, self.builds)
+        self.assertEqual(["t.tbl"], os.listdir(self.dir))
+
+    def test_off(self):
+        tablecache.set_directory(None)
+        tablecache.load("t", self.build)
+        tablecache.load("t", self.build)
+        self.assertEqual(2, self.builds)
+
+    def test_corrupt(self):
+        tablecache.load("t", self.build)
+        path = os.path.join(self.dir, "t.tbl")
+        with open(path, "r+b") as f:
+            f.seek(-1, 2)
+            f.write("X")
+        self.assertEqual("table data", str(tablecache.load("t", self.build)))
+        self.assertEqual(2, self.builds)
+
+        # Truncated
+        with open(path, "r+b") as f:
+            f.truncate(10)
+        self.assertEqual("table data", str(tablecache.load("t", self.build)))
+        self.assertEqual(3, self.builds)
+
+    def test_stale(self):
+        tablecache.load("t", self.build)
+        tablecache.load("t", self.build, length=10)
+        self.assertEqual(1, self.builds)
+        tablecache.load("t", self.build, length=11)
+        self.assertEqual(2, self.builds)
+
+    def test_unwritable(self):
+        tablecache.set_directory(os.path.join(self.dir, "file"))
+        open(os.path.join(self.dir, "file"), "w").close()
+        self.assertEqual("table data", str(tablecache.load("t", self.build)))
+
+    def test_field(self):
+        f = ff.Field(12, 0x1053, 2)
+        f.exptable
+        g = ff.Field(12, 0x1053, 2)
+        self.assertEqual(f.exptable, g.exptable)
+        self.assertEqual(f.logtable, g.logtable)
+        self.assertEqual(1, len(os.listdir(self.dir)))
+
+    @unittest.skipIf(rs.numpy is None, "NumPy is not installed")
+    def test_coder(self):
+        messages = ["".join(chr((i * j) % 256) for i in xrange(10))
+                for j in xrange(5)]
+        expected = rs.RSCoder(30, 10).encode_many(messages)
+        for i in xrange(2):
+            coder = rs.RSCoder(30, 10)
+            codes = coder.encode_many(messages)
+            self.assertTrue((codes == expected).all())
+            codes[2, 5] ^= 1
+            self.assertEqual([0, 0, 1, 0, 0],
+                    list(coder.decode_many(codes)[1]))
+        self.assertEqual(2, len(os.listdir(self.dir)))
+
+
+if __name__ == "__main__":
+    unittest.main()